@@ -1,51 +1,92 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Blueprint, Flask, Response, current_app, g, render_template, request, jsonify, redirect, url_for, flash, session, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from groq import Groq
+from psycopg2.extras import RealDictCursor, Json, execute_values
 from dotenv import load_dotenv
-import fitz  # PyMuPDF
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+import base64
+from functools import wraps
 import json
-import markdown 
+import hashlib
+import hmac
+import time
+from datetime import datetime
 
-# Imports for new file types
-import pytesseract
-from PIL import Image
-import docx
-
-# ---------------- CONFIG ----------------
+# Load .env before the local modules below: they read their settings from the
+# environment at import time.
 load_dotenv()
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv("FLASK_SECRET_KEY", "a-super-secret-key")
 
-# Groq client
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+import db
+import cache
+import concurrency
+import jobs
+import llm
+import metrics
+import syllabus
+import extraction
+import context_builder
+import documents
+import notes_sections
+import progress
+import semantic_cache
+from db import get_db_connection, pool_stats
 
-# --- Load model names from environment variables ---
-GROQ_MODEL_FAST = os.getenv("GROQ_MODEL_FAST", "gemma-7b-it")
-GROQ_MODEL_LARGE = os.getenv("GROQ_MODEL_LARGE", "gemma2-9b-it")
+# ---------------- CONFIG ----------------
+# Routes live on this blueprint; create_app() at the bottom builds the Flask app.
+bp = Blueprint("main", __name__)
 
+# --- Models; every Groq call goes through the llm.py gateway ---
+GROQ_MODEL_FAST = llm.GROQ_MODEL_FAST
+GROQ_MODEL_LARGE = llm.GROQ_MODEL_LARGE
 
-# --- UPDATED DATABASE CONFIG ---
-# This now uses a single DATABASE_URL, which is the standard for production environments like Render.
-DATABASE_URL = os.getenv("DATABASE_URL")
+# --- Context window (in tokens) for each model, used to bound chat prompts ---
+GROQ_CONTEXT_TOKENS = {
+    GROQ_MODEL_FAST: int(os.getenv("GROQ_CONTEXT_TOKENS_FAST", "8192")),
+    GROQ_MODEL_LARGE: int(os.getenv("GROQ_CONTEXT_TOKENS_LARGE", "8192")),
+}
 
 
 # --- User Authentication Setup ---
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 
 class User(UserMixin):
     def __init__(self, id, username):
         self.id = id
         self.username = username
 
+# --- User cache ---
+# Flask-Login resolves current_user on every request. Users are served from a
+# per-process TTL/LRU cache, and the username is also kept in the signed session
+# cookie so another worker can trust it for USER_CACHE_TTL seconds after the
+# last database check. Either way the database is consulted at most once per
+# TTL window per user and worker.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+user_cache = cache.TTLCache(maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")), ttl=USER_CACHE_TTL)
+
+def remember_user_in_session(user):
+    session["username"] = user.username
+    session["user_checked_at"] = time.time()
+
+def invalidate_user(user_id):
+    """Drops a user from the cache; call after logout or whenever the users row changes."""
+    user_cache.pop(str(user_id))
+    session.pop("username", None)
+    session.pop("user_checked_at", None)
+
 @login_manager.user_loader
 def load_user(user_id):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    checked_at = session.get("user_checked_at", 0)
+    if session.get("username") and time.time() - checked_at < USER_CACHE_TTL:
+        user = User(id=int(user_id), username=session["username"])
+        user_cache.set(user_id, user)
+        return user
+
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, username FROM users WHERE id = %s", (user_id,))
@@ -53,37 +94,24 @@ def load_user(user_id):
     cur.close()
     conn.close()
     if user_data:
-        return User(id=user_data[0], username=user_data[1])
+        user = User(id=user_data[0], username=user_data[1])
+        user_cache.set(user_id, user)
+        remember_user_in_session(user)
+        return user
+    invalidate_user(user_id)
     return None
 
-# --- DATABASE HELPER (UPDATED) ---
-def get_db_connection():
-    if DATABASE_URL is None:
-        raise ValueError("DATABASE_URL environment variable is not set")
-    # Connects using the single DATABASE_URL
-    return psycopg2.connect(DATABASE_URL)
-
-# --- TEXT EXTRACTION HELPERS ---
-def extract_text_from_pdf(file_stream):
-    text = ""
-    with fitz.open(stream=file_stream, filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
-
-def extract_text_from_image(file_stream):
-    image = Image.open(file_stream)
-    return pytesseract.image_to_string(image)
-
-def extract_text_from_docx(file_stream):
-    doc = docx.Document(file_stream)
-    return "\n".join([para.text for para in doc.paragraphs])
+# --- TEXT EXTRACTION ---
+# Only this many characters of an uploaded syllabus are put into the parsing
+# prompt, so extraction stops as soon as it has them (see extraction.py).
+# Chat uploads are indexed in full instead (see documents.py).
+DOCUMENT_PROMPT_CHARS = 4000
 
 # ---------------- AUTH ROUTES ----------------
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if request.method == "POST":
         username = request.form['username']
         password = request.form['password']
@@ -96,15 +124,16 @@ def login():
         if user_data and check_password_hash(user_data[1], password):
             user = User(id=user_data[0], username=username)
             login_user(user)
-            return redirect(url_for('index'))
+            remember_user_in_session(user)
+            return redirect(url_for('main.index'))
         else:
             flash("Invalid username or password")
     return render_template("login.html")
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if request.method == "POST":
         username = request.form['username']
         password = request.form['password']
@@ -123,27 +152,203 @@ def register():
             conn.commit()
             user = User(id=user_id, username=username)
             login_user(user)
-            return redirect(url_for('index'))
+            remember_user_in_session(user)
+            return redirect(url_for('main.index'))
         cur.close()
         conn.close()
     return render_template("register.html")
 
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
+
 
+# --- Per-user limits on LLM-bound routes ---
+# Routes that can wait on the LLM hold one of the user's slots until the
+# request is torn down. For a stream that is after its last event. Requests
+# beyond the cap and the short queue get a 429 with Retry-After (see
+# concurrency.py).
+user_limiter = concurrency.UserLimiter()
+TOO_MANY_REQUESTS_MESSAGE = "You already have several requests in progress. Please wait for them to finish."
+
+def limit_per_user(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            slot = user_limiter.acquire(current_user.id, route=view.__name__)
+        except concurrency.TooManyRequests as e:
+            headers = {"Retry-After": str(max(1, round(e.retry_after)))}
+            if request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json":
+                return jsonify({"error": TOO_MANY_REQUESTS_MESSAGE}), 429, headers
+            return Response(TOO_MANY_REQUESTS_MESSAGE, status=429, mimetype="text/plain", headers=headers)
+        g.user_slot = slot
+        return view(*args, **kwargs)
+    return wrapper
+
+@bp.teardown_request
+def release_user_slot(exc=None):
+    slot = g.pop("user_slot", None)
+    if slot is not None:
+        try:
+            slot.release()
+        except Exception as e:
+            # The slot's lease expires on its own; the response is already done.
+            print(f"Could not release user slot: {e}")
 
 # ---------------- APP ROUTES ----------------
-@app.route("/")
+@bp.route("/")
 @login_required
 def index():
     return render_template("index.html")
 
-@app.route("/chat", methods=["POST"])
+# --- CHAT HELPERS ---
+def wants_stream():
+    # The chat UI asks for a token stream explicitly; plain form posts still get JSON.
+    return request.form.get("stream") == "1" or "text/event-stream" in request.headers.get("Accept", "")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def summarize_conversation(previous_summary, transcript):
+    summary_prompt = f"""Update the running summary of a conversation between a user and an AI assistant.
+    Keep facts, decisions, names, documents and open questions the assistant may need later. Be concise (at most 200 words).
+
+    Current summary:
+    {previous_summary or "(none yet)"}
+
+    New messages:
+    {transcript}
+
+    Return only the updated summary."""
+    completion = llm.complete(
+        GROQ_MODEL_FAST,
+        [
+            {"role": "system", "content": "You summarize conversations accurately and concisely."},
+            {"role": "user", "content": summary_prompt}
+        ]
+    )
+    return completion.choices[0].message.content.strip()
+
+@jobs.job_handler("summarize_conversation")
+def summarize_conversation_job(job):
+    """Folds a conversation's backlog into its summary, off the chat request."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    context = context_builder.load_context(cur, job["payload"]["conversation_id"], job["user_id"])
+    conn.commit()
+    cur.close()
+    conn.close()
+    if context is None or not context.fold:
+        return {"summarized_through_id": None}
+
+    with metrics.phase("summary_refresh"):
+        summarized = context_builder.summarize_fold(context, summarize_conversation)
+    if summarized:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        context_builder.save_summary(cur, context)
+        conn.commit()
+        cur.close()
+        conn.close()
+    return {"summarized_through_id": context.summarized_through_id if summarized else None}
+
+def enqueue_summary(cur, context, user_id):
+    """Queues a fold of the context's backlog; until it runs the backlog stays in the recent window."""
+    context.recent = context.fold + context.recent
+    context.fold = []
+    return jobs.enqueue(cur, "summarize_conversation", {"conversation_id": context.conversation_id},
+        user_id=user_id, dedupe_key=str(context.conversation_id))
+
+def save_chat_turn(cur, conversation_id, user_record, bot_response):
+    """Stores a turn and bumps the conversation's activity in one statement."""
+    rows = [(conversation_id, "user", user_record)] if user_record else []
+    rows.append((conversation_id, "bot", bot_response))
+    cur.execute(
+        f"""WITH inserted AS (
+                INSERT INTO chat_history (conversation_id, sender, message)
+                VALUES {", ".join(["(%s, %s, %s)"] * len(rows))}
+                RETURNING id
+            )
+            UPDATE conversations
+            SET updated_at = NOW(), message_count = message_count + (SELECT COUNT(*) FROM inserted)
+            WHERE id = %s""",
+        [value for row in rows for value in row] + [conversation_id])
+
+def discard_empty_conversation(conversation_id):
+    """Deletes a conversation the failed request created if no turn was stored in it.
+
+    The client only adopts a conversation id once a reply succeeded, so an
+    empty conversation left behind would just clutter the sidebar.
+    """
+    try:
+        conn = get_db_connection()
+        conn.rollback()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM conversations WHERE id = %s AND user_id = %s AND message_count = 0",
+            (conversation_id, current_user.id))
+        conn.commit()
+        cur.close()
+        conn.close()
+    except Exception as e:
+        print(f"Could not discard empty conversation {conversation_id}: {e}")
+
+LLM_BUSY_MESSAGE = "The AI service is busy right now. Please try again shortly."
+
+def stream_chat_reply(conversation_id, messages, user_record, cached_answer=None, cache_vector=None,
+                      new_conversation_id=None, summary_job_id=None):
+    """Yields the reply as SSE events and stores it once the stream ends.
+
+    The turn is persisted in the finally block, so a reply that fails part way
+    or is cut off by the client disconnecting is still saved with whatever
+    text had arrived. If no text arrived nothing is stored: an error message
+    saved as a reply would be sent back to the model with later turns.
+    """
+    parts = []
+    try:
+        yield sse_event("meta", {"conversation_id": conversation_id, "cached": cached_answer is not None})
+        if cached_answer is not None:
+            parts.append(cached_answer)
+            yield sse_event("token", {"content": cached_answer})
+        elif len(messages) > 1:
+            for delta in llm.stream(GROQ_MODEL_FAST, messages):
+                parts.append(delta)
+                yield sse_event("token", {"content": delta})
+            semantic_cache.store(current_user.id, cache_vector, "".join(parts))
+        yield sse_event("done", {"conversation_id": conversation_id})
+    except llm.LLMUnavailable as e:
+        print(f"LLM unavailable in /chat stream: {e}")
+        yield sse_event("error", {"error": LLM_BUSY_MESSAGE})
+    except Exception as e:
+        import traceback
+        print("🔥 ERROR in /chat stream:", traceback.format_exc())
+        yield sse_event("error", {"error": str(e)})
+    finally:
+        bot_response = "".join(parts)
+        if not bot_response and new_conversation_id is not None:
+            discard_empty_conversation(new_conversation_id)
+        elif bot_response:
+            try:
+                with metrics.phase("db_write"):
+                    conn = get_db_connection()
+                    cur = conn.cursor()
+                    save_chat_turn(cur, conversation_id, user_record, bot_response)
+                    conn.commit()
+                    cur.close()
+                    conn.close()
+            except Exception:
+                import traceback
+                print("🔥 ERROR saving streamed chat turn:", traceback.format_exc())
+        if summary_job_id is not None:
+            jobs.dispatch(current_app._get_current_object(), summary_job_id)
+
+@bp.route("/chat", methods=["POST"])
 @login_required
+@limit_per_user
 def chat():
+    new_conversation_id = None
     try:
         user_message = request.form.get("message")
         conversation_id = request.form.get("conversation_id")
@@ -168,85 +373,213 @@ def chat():
                 "INSERT INTO conversations (title, user_id) VALUES (%s, %s) RETURNING id",
                 (title, current_user.id)
             )
-            conversation_id = cur.fetchone()[0]
-        else:
-            cur.execute("SELECT id FROM conversations WHERE id = %s AND user_id = %s", (conversation_id, current_user.id))
-            if not cur.fetchone():
-                return jsonify({"error": "Unauthorized"}), 403
+            conversation_id = new_conversation_id = cur.fetchone()[0]
+
+        # Only the rolling summary and the latest turns are loaded, never the full history.
+        with metrics.phase("history_fetch"):
+            context = context_builder.load_context(cur, conversation_id, current_user.id)
+        if context is None:
+            return jsonify({"error": "Unauthorized"}), 403
+
+        file_text, file_key, file_data = None, None, None
+        if file:
+            file_data = file.read()
+            file_key = extraction.extraction_cache_key(file.filename, file_data, documents.DOCUMENT_INDEX_MAX_CHARS)
+            with metrics.phase("file_extraction"):
+                file_text = extraction.lookup_cached_text(cur, file_key)
 
-        cur.execute("SELECT sender, message FROM chat_history WHERE conversation_id = %s ORDER BY id ASC", (conversation_id,))
-        rows = cur.fetchall()
+        # Folding older messages into the summary is an LLM call of its own,
+        # so it is left to a job and never delays the reply.
+        summary_job_id = None
+        if context.fold:
+            summary_job_id = enqueue_summary(cur, context, current_user.id)
 
-        messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
-        for sender, message in rows:
-            role = "user" if sender == "user" else "assistant"
-            messages.append({"role": role, "content": message})
+        # Extracting an uncached upload (possibly OCR) is slow, so the
+        # connection goes back to the pool while it runs and the result is
+        # written on a fresh checkout.
+        if file and file_text is None:
+            conn.commit()
+            cur.close()
+            conn.close()
+            with metrics.phase("file_extraction"):
+                file_text, file_complete = extraction.extract_text(file.filename, file_data,
+                    max_chars=documents.DOCUMENT_INDEX_MAX_CHARS)
+            conn = get_db_connection()
+            cur = conn.cursor()
+            if file_complete:
+                extraction.store_cached_text(cur, file_key, file_text)
 
-        file_text = ""
         if file:
-            filename = file.filename.lower()
-            file_stream = file.read()
-            if filename.endswith('.pdf'):
-                file_text = extract_text_from_pdf(file_stream)
-            elif filename.endswith(('.png', '.jpg', '.jpeg')):
-                file_text = extract_text_from_image(file_stream)
-            elif filename.endswith('.docx'):
-                file_text = extract_text_from_docx(file_stream)
-            
-            prompt_content = f"Use the following document text to answer my questions:\n\n---\n{file_text[:4000]}\n---\n\n{user_message or ''}"
-            messages.append({"role": "user", "content": prompt_content})
-        elif user_message:
-            messages.append({"role": "user", "content": user_message})
-
-        if len(messages) > 1:
-            completion = groq_client.chat.completions.create(
-                messages=messages, 
-                model=GROQ_MODEL_FAST
-            )
-            bot_response = completion.choices[0].message.content
+            # The whole document is indexed once; this and later turns only see the relevant parts.
+            with metrics.phase("document_index"):
+                documents.index_document(cur, conversation_id, file.filename, file_text)
+
+        question = user_message or (f"Summarize this document: {file.filename}" if file else "")
+        with metrics.phase("document_retrieval"):
+            excerpts = documents.retrieve(cur, conversation_id, question)
+
+        new_messages = []
+        if excerpts:
+            prompt_content = (f"Use the following excerpts from my uploaded documents to answer my questions:"
+                              f"\n\n---\n{documents.format_excerpts(excerpts)}\n---\n\n{question}")
+            new_messages.append({"role": "user", "content": prompt_content})
+        elif question:
+            new_messages.append({"role": "user", "content": question})
+
+        messages = context_builder.build_messages(
+            "You are a helpful AI assistant.", context, new_messages, GROQ_CONTEXT_TOKENS[GROQ_MODEL_FAST])
 
+        user_record = None
         if user_message or file:
-            cur.execute("INSERT INTO chat_history (conversation_id, sender, message) VALUES (%s, %s, %s)",
-                (conversation_id, "user", user_message or f"File uploaded: {file.filename}"))
-        cur.execute("INSERT INTO chat_history (conversation_id, sender, message) VALUES (%s, %s, %s)",
-            (conversation_id, "bot", bot_response))
+            user_record = user_message or f"File uploaded: {file.filename}"
 
+        # Only plain-text turns go through the semantic cache; document excerpts make every prompt unique.
+        cached_answer, cache_vector = None, None
+        if user_message and not excerpts:
+            with metrics.phase("semantic_cache"):
+                cached_answer, cache_vector = semantic_cache.lookup(
+                    current_user.id, user_message, [message for _, _, message in context.recent])
+
+        # Commit the new conversation and give the connection back before the
+        # LLM call; the reply is written afterwards on a fresh checkout.
         conn.commit()
         cur.close()
         conn.close()
-        return jsonify({"response": bot_response, "conversation_id": conversation_id})
 
+        if wants_stream():
+            return Response(
+                stream_with_context(stream_chat_reply(conversation_id, messages, user_record, cached_answer, cache_vector,
+                                                  new_conversation_id, summary_job_id)),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        replied = True
+        if cached_answer is not None:
+            bot_response = cached_answer
+        elif len(messages) > 1:
+            completion = llm.complete(GROQ_MODEL_FAST, messages)
+            bot_response = completion.choices[0].message.content
+            semantic_cache.store(current_user.id, cache_vector, bot_response)
+        else:
+            replied = False
+
+        # Like the stream, only a real reply is stored, never the fallback message.
+        if replied:
+            with metrics.phase("db_write"):
+                conn = get_db_connection()
+                cur = conn.cursor()
+                save_chat_turn(cur, conversation_id, user_record, bot_response)
+                conn.commit()
+                cur.close()
+                conn.close()
+        elif new_conversation_id is not None:
+            discard_empty_conversation(new_conversation_id)
+        if summary_job_id is not None:
+            jobs.dispatch(current_app._get_current_object(), summary_job_id)
+        return jsonify({"response": bot_response, "conversation_id": conversation_id,
+                        "cached": cached_answer is not None})
+
+    except llm.LLMUnavailable as e:
+        print(f"LLM unavailable in /chat: {e}")
+        if new_conversation_id is not None:
+            discard_empty_conversation(new_conversation_id)
+        response = jsonify({"error": LLM_BUSY_MESSAGE})
+        response.status_code = 503
+        if e.retry_after:
+            response.headers["Retry-After"] = str(max(1, round(e.retry_after)))
+        return response
     except Exception as e:
         import traceback
         print("🔥 ERROR in /chat route:", traceback.format_exc())
+        if new_conversation_id is not None:
+            discard_empty_conversation(new_conversation_id)
         return jsonify({"error": str(e)}), 500
 
-@app.route("/get_conversations", methods=["GET"])
+# --- History pagination ---
+# Both history endpoints use keyset pagination: a page is "the next N rows
+# after this cursor" in index order, so deep pages cost the same as the first
+# and rows inserted meanwhile never shift or duplicate results.
+CONVERSATIONS_PAGE_SIZE = 30
+HISTORY_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_limit(default):
+    limit = request.args.get("limit", type=int) or default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        return None
+
+@bp.route("/get_conversations", methods=["GET"])
 @login_required
 def get_conversations():
+    """Most recently active conversations first. Pass `cursor` from the previous page's `next_cursor`."""
+    limit = page_limit(CONVERSATIONS_PAGE_SIZE)
+    cursor = request.args.get("cursor")
+    if cursor:
+        position = decode_cursor(cursor)
+        try:
+            updated_at, last_id = datetime.fromisoformat(position[0]), int(position[1])
+        except (TypeError, ValueError, KeyError, IndexError):
+            return jsonify({"error": "Invalid cursor"}), 400
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT id, title FROM conversations WHERE user_id = %s ORDER BY created_at DESC", (current_user.id,))
-    conversations = cur.fetchall()
+    if cursor:
+        cur.execute("""SELECT id, title, updated_at, message_count FROM conversations
+                       WHERE user_id = %s AND (updated_at, id) < (%s, %s)
+                       ORDER BY updated_at DESC, id DESC LIMIT %s""",
+                    (current_user.id, updated_at, last_id, limit + 1))
+    else:
+        cur.execute("""SELECT id, title, updated_at, message_count FROM conversations WHERE user_id = %s
+                       ORDER BY updated_at DESC, id DESC LIMIT %s""", (current_user.id, limit + 1))
+    rows = cur.fetchall()
     cur.close()
     conn.close()
-    return jsonify(conversations)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["updated_at"].isoformat(), rows[-1]["id"])
+    conversations = [{"id": row["id"], "title": row["title"], "message_count": row["message_count"],
+                      "updated_at": row["updated_at"].isoformat()} for row in rows]
+    return jsonify({"conversations": conversations, "next_cursor": next_cursor})
 
-@app.route("/get_chat/<int:conversation_id>", methods=["GET"])
+@bp.route("/get_chat/<int:conversation_id>", methods=["GET"])
 @login_required
 def get_chat(conversation_id):
+    """The latest messages of a conversation, oldest first.
+
+    Pass `before` (the previous page's `next_before`) to page back through older messages.
+    """
+    limit = page_limit(HISTORY_PAGE_SIZE)
+    before = request.args.get("before", type=int)
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     cur.execute("SELECT id FROM conversations WHERE id = %s AND user_id = %s", (conversation_id, current_user.id))
     if not cur.fetchone():
         return jsonify({"error": "Unauthorized"}), 403
-    cur.execute("SELECT sender, message FROM chat_history WHERE conversation_id = %s ORDER BY created_at ASC", (conversation_id,))
-    messages = cur.fetchall()
+    if before is not None:
+        cur.execute("""SELECT id, sender, message FROM chat_history
+                       WHERE conversation_id = %s AND id < %s ORDER BY id DESC LIMIT %s""",
+                    (conversation_id, before, limit + 1))
+    else:
+        cur.execute("""SELECT id, sender, message FROM chat_history
+                       WHERE conversation_id = %s ORDER BY id DESC LIMIT %s""", (conversation_id, limit + 1))
+    rows = cur.fetchall()
     cur.close()
     conn.close()
-    return jsonify(messages)
-    
-@app.route("/delete_conversation/<int:conversation_id>", methods=["DELETE"])
+    has_more = len(rows) > limit
+    messages = rows[:limit][::-1]
+    next_before = messages[0]["id"] if has_more else None
+    return jsonify({"messages": messages, "next_before": next_before})
+
+@bp.route("/delete_conversation/<int:conversation_id>", methods=["DELETE"])
 @login_required
 def delete_conversation(conversation_id):
     try:
@@ -264,146 +597,311 @@ def delete_conversation(conversation_id):
         print(f"Error deleting conversation: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/dashboard")
+@bp.route("/dashboard")
 @login_required
 def dashboard():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT id, name, progress FROM subjects WHERE user_id = %s ORDER BY name", (current_user.id,))
-    subjects = cur.fetchall()
+    subjects = progress.load_dashboard(cur, current_user.id)
+    cur.execute("SELECT id FROM jobs WHERE user_id = %s AND kind = 'parse_syllabus' AND status IN ('queued', 'running')",
+        (current_user.id,))
+    pending_job_ids = [row['id'] for row in cur.fetchall()]
     cur.close()
     conn.close()
-    return render_template("dashboard.html", subjects=subjects)
+    return render_template("dashboard.html", subjects=subjects, pending_job_ids=pending_job_ids)
 
-@app.route("/upload_syllabus", methods=["POST"])
+@bp.route("/upload_syllabus", methods=["POST"])
 @login_required
+@limit_per_user
 def upload_syllabus():
     if 'syllabus_file' not in request.files:
         flash("No file part")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     file = request.files['syllabus_file']
     if file.filename == '':
         flash("No selected file")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     if file and file.filename.endswith('.pdf'):
         try:
             filename = secure_filename(file.filename)
-            pdf_text = extract_text_from_pdf(file.read())
-            
-            parsing_prompt = f"""Parse the following syllabus text into a structured JSON object. The JSON should have a single key "subjects", which is an array of objects. Each object should have two keys: "name" (the subject name) and "topics" (an array of strings, where each string is a topic or unit). Syllabus Text: --- {pdf_text[:4000]} --- """
-            completion = groq_client.chat.completions.create(
-                messages=[{"role": "system", "content": "You are a JSON parsing expert."}, {"role": "user", "content": parsing_prompt}],
-                model=GROQ_MODEL_FAST,
-                response_format={"type": "json_object"}
-            )
-            parsed_data = json.loads(completion.choices[0].message.content)
-            
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("INSERT INTO syllabuses (user_id, filename, parsed_content) VALUES (%s, %s, %s) RETURNING id",
-                (current_user.id, filename, json.dumps(parsed_data)))
-            syllabus_id = cur.fetchone()[0]
-            for subject_data in parsed_data.get("subjects", []):
-                cur.execute("INSERT INTO subjects (syllabus_id, user_id, name) VALUES (%s, %s, %s) RETURNING id",
-                    (syllabus_id, current_user.id, subject_data.get("name")))
-                subject_id = cur.fetchone()[0]
-                for topic_name in subject_data.get("topics", []):
-                    cur.execute("INSERT INTO topics (subject_id, name) VALUES (%s, %s)", (subject_id, topic_name))
+            job_id = jobs.enqueue(cur, "parse_syllabus", {"filename": filename},
+                user_id=current_user.id, blob=file.read())
             conn.commit()
             cur.close()
             conn.close()
-            flash("Syllabus uploaded and processed successfully!")
+            jobs.dispatch(current_app._get_current_object(), job_id)
+            flash("Syllabus uploaded! Subjects will appear here as soon as it has been processed.")
         except Exception as e:
             flash(f"An error occurred: {str(e)}")
             print(f"Syllabus Upload Error: {e}")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     else:
         flash("Invalid file type. Please upload a PDF.")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
+
+@jobs.job_handler("parse_syllabus")
+def parse_syllabus_job(job):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    with metrics.phase("file_extraction"):
+        pdf_text = extraction.extract_text_cached(cur, job["payload"]["filename"], job["input_blob"],
+            max_chars=DOCUMENT_PROMPT_CHARS)
+    conn.commit()
+    cur.close()
+    conn.close()
 
-@app.route("/view_notes/<int:subject_id>")
+    parsing_prompt = f"""Parse the following syllabus text into a structured JSON object. The JSON should have a single key "subjects", which is an array of objects. Each object should have two keys: "name" (the subject name) and "topics" (an array of strings, where each string is a topic or unit). Syllabus Text: --- {pdf_text} --- """
+    completion = llm.complete(
+        GROQ_MODEL_FAST,
+        [{"role": "system", "content": "You are a JSON parsing expert."}, {"role": "user", "content": parsing_prompt}],
+        response_format={"type": "json_object"}
+    )
+    parsed_data = json.loads(completion.choices[0].message.content)
+
+    # Everything is written in one transaction, so a retried job never leaves half a syllabus behind.
+    with metrics.phase("db_write"):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        syllabus_id, subject_count = syllabus.insert_syllabus(
+            cur, job["user_id"], job["payload"]["filename"], parsed_data)
+        conn.commit()
+    cur.close()
+    conn.close()
+    return {"syllabus_id": syllabus_id, "subjects": subject_count}
+
+# Ids of jobs handed to this user that another user may have enqueued
+# (deduplicated notes and quiz-bank jobs), so job_status can show them.
+SESSION_JOB_IDS = 20
+
+def remember_job(job_id):
+    if job_id is not None:
+        session["job_ids"] = ([i for i in session.get("job_ids", []) if i != job_id] + [job_id])[-SESSION_JOB_IDS:]
+
+@bp.route("/jobs/<int:job_id>")
 @login_required
+def job_status(job_id):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    job = jobs.get_job(cur, job_id, current_user.id, shared=job_id in session.get("job_ids", ()))
+    cur.close()
+    conn.close()
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+# --- STUDY NOTES HELPERS ---
+# Bump NOTES_PROMPT_VERSION whenever the notes prompt changes so cached notes are regenerated.
+NOTES_PROMPT_VERSION = "1"
+
+def notes_cache_key(subject_name, topic_names, model):
+    # Content address: identical subject/topics/prompt/model always map to the same notes.
+    payload = json.dumps([subject_name, sorted(topic_names), NOTES_PROMPT_VERSION, model])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def generate_notes_markdown(subject_name, topic_names):
+    topics_str = ", ".join(topic_names)
+    notes_prompt = f"""
+    Act as a master technical writer and educator, combining the detailed, example-rich style of GeeksForGeeks and Javatpoint.
+    Your mission is to create a **deeply comprehensive and easily understandable** study guide on the subject of '{subject_name}', focusing on the following topics: **{topics_str}**.
+
+    For each topic, you must provide the following in a clear, topic-wise structure:
+    1.  **In-Depth Explanation:** Elaborate on the core concepts. Use simple analogies and clear, step-by-step explanations to demystify complex ideas.
+    2.  **Illustrative Examples:** Provide well-commented code snippets (if applicable) or practical, real-world examples to demonstrate the topic's application.
+    3.  **Diagrams and Visuals (using Mermaid JS):** Where a concept can be better explained with a diagram (e.g., flowcharts, architecture, data structures, hierarchies), **generate the diagram using Mermaid.js syntax**. Enclose the Mermaid code in a markdown code block with the language identifier 'mermaid'. For example:
+        ```mermaid
+        graph TD;
+            A-->B;
+            A-->C;
+            B-->D;
+            C-->D;
+        ```
+    4.  **Key Summary Points:** Conclude each topic with a bulleted list of the most critical takeaways.
+
+    The final output must be a single, cohesive document in Markdown, beginning with an introduction and ending with a final summary. The tone must be authoritative yet accessible.
+    """
+
+    completion = llm.complete(
+        GROQ_MODEL_LARGE,
+        [
+            {"role": "system", "content": "You are an expert tutor who creates excellent, detailed study materials with diagrams."},
+            {"role": "user", "content": notes_prompt}
+        ]
+    )
+    return completion.choices[0].message.content
+
+def store_cached_notes(cur, cache_key, model, notes_markdown):
+    # Rendered HTML lives per section in notes_sections (see notes_sections.py).
+    cur.execute("""INSERT INTO notes_cache (cache_key, model, prompt_version, notes_markdown)
+                   VALUES (%s, %s, %s, %s)
+                   ON CONFLICT (cache_key) DO UPDATE
+                   SET notes_markdown = EXCLUDED.notes_markdown,
+                       notes_html = NULL,
+                       created_at = NOW(),
+                       last_used_at = NOW()""",
+        (cache_key, model, NOTES_PROMPT_VERSION, notes_markdown))
+    with metrics.phase("markdown_render"):
+        notes_sections.store_sections(cur, cache_key, notes_markdown)
+
+def load_subject_topics(cur, subject_id):
+    cur.execute("SELECT id, name FROM subjects WHERE id = %s AND user_id = %s", (subject_id, current_user.id))
+    subject = cur.fetchone()
+    if not subject:
+        return None, []
+    cur.execute("SELECT name FROM topics WHERE subject_id = %s ORDER BY id", (subject_id,))
+    return subject, [row['name'] for row in cur.fetchall()]
+
+# Repeated requests for the same notes, from any user or process, are merged
+# into one job by the jobs table (dedupe_key).
+@bp.route("/view_notes/<int:subject_id>")
+@login_required
+@limit_per_user
 def view_notes(subject_id):
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT id, name FROM subjects WHERE id = %s AND user_id = %s", (subject_id, current_user.id))
-        subject = cur.fetchone()
+        with metrics.phase("db_read"):
+            subject, topic_names = load_subject_topics(cur, subject_id)
 
         if not subject:
             flash("Subject not found.")
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
 
-        cur.execute("SELECT name FROM topics WHERE subject_id = %s", (subject_id,))
-        topics_rows = cur.fetchall()
-        topic_names = [row['name'] for row in topics_rows]
-        topics_str = ", ".join(topic_names)
+        cache_key = notes_cache_key(subject['name'], topic_names, GROQ_MODEL_LARGE)
+        cur.close()
+        cur = conn.cursor()
+        with metrics.phase("cache_lookup"):
+            sections, notes_version = notes_sections.load_outline(cur, cache_key)
+            conn.commit()
         cur.close()
         conn.close()
 
-        notes_prompt = f"""
-        Act as a master technical writer and educator, combining the detailed, example-rich style of GeeksForGeeks and Javatpoint.
-        Your mission is to create a **deeply comprehensive and easily understandable** study guide on the subject of '{subject['name']}', focusing on the following topics: **{topics_str}**.
-
-        For each topic, you must provide the following in a clear, topic-wise structure:
-        1.  **In-Depth Explanation:** Elaborate on the core concepts. Use simple analogies and clear, step-by-step explanations to demystify complex ideas.
-        2.  **Illustrative Examples:** Provide well-commented code snippets (if applicable) or practical, real-world examples to demonstrate the topic's application.
-        3.  **Diagrams and Visuals (using Mermaid JS):** Where a concept can be better explained with a diagram (e.g., flowcharts, architecture, data structures, hierarchies), **generate the diagram using Mermaid.js syntax**. Enclose the Mermaid code in a markdown code block with the language identifier 'mermaid'. For example:
-            ```mermaid
-            graph TD;
-                A-->B;
-                A-->C;
-                B-->D;
-                C-->D;
-            ```
-        4.  **Key Summary Points:** Conclude each topic with a bulleted list of the most critical takeaways.
-
-        The final output must be a single, cohesive document in Markdown, beginning with an introduction and ending with a final summary. The tone must be authoritative yet accessible.
-        """
+        if sections is not None:
+            # Only the first sections are rendered into the page; the rest load as the reader scrolls.
+            with metrics.phase("template_render"):
+                return render_template("notes.html", subject=subject, sections=sections,
+                    notes_version=notes_version, section_batch=notes_sections.NOTES_SECTION_BATCH)
 
-        completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are an expert tutor who creates excellent, detailed study materials with diagrams."},
-                {"role": "user", "content": notes_prompt}
-            ],
-            model=GROQ_MODEL_LARGE
-        )
-        
-        notes_markdown = completion.choices[0].message.content
-        notes_html = markdown.markdown(notes_markdown, extensions=['fenced_code'])
+        # Cache miss: generate in the background and let the page poll for the result.
+        conn = get_db_connection()
+        cur = conn.cursor()
+        job_id = jobs.enqueue(cur, "generate_notes",
+            {"cache_key": cache_key, "subject_name": subject['name'], "topic_names": topic_names},
+            user_id=current_user.id, dedupe_key=cache_key)
+        conn.commit()
+        cur.close()
+        conn.close()
+        jobs.dispatch(current_app._get_current_object(), job_id)
+        remember_job(job_id)
 
-        return render_template("notes.html", subject=subject, notes_html=notes_html, notes_markdown=notes_markdown)
+        return render_template("notes.html", subject=subject, sections=None, job_id=job_id)
 
     except Exception as e:
         flash(f"Could not generate study notes at this time. Error: {str(e)}")
         print(f"Notes Generation Error: {e}")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-@app.route("/generate_quiz/<int:subject_id>", methods=["GET", "POST"])
-@login_required
-def generate_quiz(subject_id):
-    if request.method == "GET":
-        flash("Please generate notes before taking a quiz.")
-        return redirect(url_for('dashboard'))
-        
-    try:
+@jobs.job_handler("generate_notes")
+def generate_notes_job(job):
+    payload = job["payload"]
+    notes_markdown = generate_notes_markdown(payload["subject_name"], payload["topic_names"])
+
+    with metrics.phase("db_write"):
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT id, name FROM subjects WHERE id = %s AND user_id = %s", (subject_id, current_user.id))
-        subject = cur.fetchone()
-        cur.close()
-        conn.close()
+        cur = conn.cursor()
+        store_cached_notes(cur, payload["cache_key"], GROQ_MODEL_LARGE, notes_markdown)
+        # Start filling the question bank so the first quiz is ready by the time it is needed.
+        enqueue_quiz_refill(cur, payload["cache_key"], job["user_id"])
+        conn.commit()
+    cur.close()
+    conn.close()
+    return {"cache_key": payload["cache_key"]}
 
-        if not subject:
-            flash("Subject not found.")
-            return redirect(url_for('dashboard'))
-            
-        notes_text = request.form.get('notes_text')
-        if not notes_text:
-            flash("Notes were not provided for quiz generation.")
-            return redirect(url_for('view_notes', subject_id=subject.id))
+@bp.route("/view_notes/<int:subject_id>/sections")
+@login_required
+def notes_section_batch(subject_id):
+    start = max(0, request.args.get("start", 0, type=int))
+    count = max(1, min(request.args.get("count", notes_sections.NOTES_SECTION_BATCH, type=int), 20))
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    subject, topic_names = load_subject_topics(cur, subject_id)
+    if not subject:
+        return jsonify({"error": "Subject not found"}), 404
+    cache_key = notes_cache_key(subject['name'], topic_names, GROQ_MODEL_LARGE)
+    cur.close()
+    cur = conn.cursor()
+    sections, notes_version = notes_sections.load_sections(cur, cache_key, start, count)
+    conn.commit()
+    cur.close()
+    conn.close()
+    response = jsonify({"sections": sections})
+    if notes_version is not None and request.args.get("v") == notes_version:
+        # The version is derived from the stored notes, so a URL carrying it always names the same content.
+        response.headers["Cache-Control"] = "private, max-age=86400"
+    return response
 
-        mcq_prompt = f"""
+@bp.route("/regenerate_notes/<int:subject_id>", methods=["POST"])
+@login_required
+def regenerate_notes(subject_id):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    subject, topic_names = load_subject_topics(cur, subject_id)
+    if not subject:
+        flash("Subject not found.")
+        return redirect(url_for('main.dashboard'))
+    cur.execute("DELETE FROM notes_cache WHERE cache_key = %s",
+        (notes_cache_key(subject['name'], topic_names, GROQ_MODEL_LARGE),))
+    conn.commit()
+    cur.close()
+    conn.close()
+    return redirect(url_for('main.view_notes', subject_id=subject_id))
+
+# --- QUIZ QUESTION BANK ---
+# Questions are generated from the cached notes by a background job and kept
+# in quiz_questions, keyed by the notes' cache key. A quiz is a sample of the
+# least-served questions, so taking one costs no LLM call; the bank is topped
+# up in the background once it is small or its questions have all been seen
+# QUIZ_MAX_SERVES times. Answers never leave the server: the served question
+# ids are kept in the session and graded against the bank.
+QUIZ_SIZE = 10
+QUIZ_BANK_MIN = int(os.getenv("QUIZ_BANK_MIN", "30"))
+QUIZ_BANK_MAX = int(os.getenv("QUIZ_BANK_MAX", "100"))
+QUIZ_MAX_SERVES = int(os.getenv("QUIZ_MAX_SERVES", "5"))
+# Existing questions listed in the refill prompt so the model avoids repeats.
+QUIZ_AVOID_QUESTIONS = 40
+
+def quiz_bank_stats(cur, notes_key):
+    cur.execute("""SELECT COUNT(*) AS size, COALESCE(MIN(served_count), 0) AS min_served
+                   FROM quiz_questions WHERE notes_cache_key = %s""", (notes_key,))
+    row = cur.fetchone()
+    return row['size'], row['min_served']
+
+def quiz_bank_needs_refill(bank_size, min_served):
+    if bank_size < max(QUIZ_SIZE, QUIZ_BANK_MIN):
+        return True
+    return bank_size < QUIZ_BANK_MAX and min_served >= QUIZ_MAX_SERVES
+
+def sample_quiz_questions(cur, notes_key, count=QUIZ_SIZE):
+    cur.execute("""UPDATE quiz_questions SET served_count = served_count + 1
+                   WHERE id IN (SELECT id FROM quiz_questions WHERE notes_cache_key = %s
+                                ORDER BY served_count, random() LIMIT %s)
+                   RETURNING id, question, options""", (notes_key, count))
+    return cur.fetchall()
+
+def enqueue_quiz_refill(cur, notes_key, user_id):
+    return jobs.enqueue(cur, "refill_quiz_bank", {"notes_cache_key": notes_key},
+        user_id=user_id, dedupe_key=notes_key)
+
+def generate_mcqs(notes_text, avoid_questions=()):
+    avoid = ""
+    if avoid_questions:
+        listed = "\n".join(f"- {q}" for q in avoid_questions)
+        avoid = f"""
+        Do NOT repeat or rephrase any of these existing questions; cover other parts of the notes instead:
+        {listed}
+        """
+    mcq_prompt = f"""
         Based **ONLY** on the following study notes, generate 10 multiple-choice questions.
         Each question must be directly answerable from the provided text.
         Ensure options are plausible but only one is correct according to the notes.
@@ -411,7 +909,7 @@ def generate_quiz(subject_id):
         --- STUDY NOTES START ---
         {notes_text}
         --- STUDY NOTES END ---
-
+        {avoid}
         Provide the output as a single, clean JSON object with one key: "mcqs".
         The value of "mcqs" must be an array of 10 question objects.
         Each question object must have three keys:
@@ -420,80 +918,159 @@ def generate_quiz(subject_id):
         3. "answer": A string that is an exact match to the correct option.
         """
 
-        completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a quiz generator that creates questions strictly from the provided text."},
-                {"role": "user", "content": mcq_prompt}
-            ],
-            model=GROQ_MODEL_FAST,
-            response_format={"type": "json_object"}
-        )
+    completion = llm.complete(
+        GROQ_MODEL_FAST,
+        [
+            {"role": "system", "content": "You are a quiz generator that creates questions strictly from the provided text."},
+            {"role": "user", "content": mcq_prompt}
+        ],
+        response_format={"type": "json_object"}
+    )
+    mcqs = json.loads(completion.choices[0].message.content).get("mcqs", [])
+    # Only keep well-formed questions whose answer is one of the options.
+    return [mcq for mcq in mcqs
+            if isinstance(mcq, dict) and isinstance(mcq.get("question"), str)
+            and isinstance(mcq.get("options"), list) and len(mcq["options"]) >= 2
+            and mcq.get("answer") in mcq["options"]]
 
-        mcq_data = json.loads(completion.choices[0].message.content)
-        
-        return render_template("quiz.html", subject=subject, mcqs=mcq_data.get("mcqs", []))
+@jobs.job_handler("refill_quiz_bank")
+def refill_quiz_bank_job(job):
+    notes_key = job["payload"]["notes_cache_key"]
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT notes_markdown FROM notes_cache WHERE cache_key = %s", (notes_key,))
+    row = cur.fetchone()
+    if row is None:
+        cur.close()
+        conn.close()
+        return {"added": 0}
+    cur.execute("SELECT question FROM quiz_questions WHERE notes_cache_key = %s ORDER BY id DESC LIMIT %s",
+        (notes_key, QUIZ_AVOID_QUESTIONS))
+    existing = [r[0] for r in cur.fetchall()]
+    cur.close()
+    conn.close()
+
+    mcqs = generate_mcqs(row[0], existing)
+
+    with metrics.phase("db_write"):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        execute_values(cur,
+            """INSERT INTO quiz_questions (notes_cache_key, question, options, answer) VALUES %s
+               ON CONFLICT (notes_cache_key, md5(question)) DO NOTHING""",
+            [(notes_key, mcq["question"], Json([str(o) for o in mcq["options"]]), str(mcq["answer"])) for mcq in mcqs])
+        added = cur.rowcount
+        conn.commit()
+    cur.close()
+    conn.close()
+    return {"added": added}
+
+@bp.route("/generate_quiz/<int:subject_id>", methods=["POST"])
+@login_required
+@limit_per_user
+def generate_quiz(subject_id):
+    """Serves a quiz. POST only: it marks the questions as served and may queue a bank refill."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        subject, topic_names = load_subject_topics(cur, subject_id)
+        if not subject:
+            flash("Subject not found.")
+            return redirect(url_for('main.dashboard'))
+
+        notes_key = notes_cache_key(subject['name'], topic_names, GROQ_MODEL_LARGE)
+        cur.execute("SELECT 1 FROM notes_cache WHERE cache_key = %s", (notes_key,))
+        if cur.fetchone() is None:
+            flash("Please generate notes before taking a quiz.")
+            return redirect(url_for('main.view_notes', subject_id=subject['id']))
+
+        with metrics.phase("db_read"):
+            bank_size, min_served = quiz_bank_stats(cur, notes_key)
+            mcqs = sample_quiz_questions(cur, notes_key) if bank_size >= QUIZ_SIZE else []
+        cur.close()
+        job_id = None
+        if quiz_bank_needs_refill(bank_size, min_served):
+            cur = conn.cursor()
+            job_id = enqueue_quiz_refill(cur, notes_key, current_user.id)
+            remember_job(job_id)
+            cur.close()
+        conn.commit()
+        conn.close()
+
+        if not mcqs:
+            # First quiz for these notes: wait for the bank to be filled.
+            jobs.dispatch(current_app._get_current_object(), job_id)
+            if jobs.JOBS_INLINE:
+                conn = get_db_connection()
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                mcqs = sample_quiz_questions(cur, notes_key)
+                conn.commit()
+                cur.close()
+                conn.close()
+            if not mcqs:
+                return render_template("quiz.html", subject=subject, mcqs=None, job_id=job_id)
+
+        session[f"quiz_{subject_id}"] = [mcq['id'] for mcq in mcqs]
+        with metrics.phase("template_render"):
+            return render_template("quiz.html", subject=subject, mcqs=mcqs)
 
     except Exception as e:
         flash(f"Could not generate a quiz at this time. Error: {str(e)}")
         print(f"Quiz Generation Error: {e}")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-@app.route("/submit_quiz/<int:subject_id>", methods=["POST"])
+@bp.route("/submit_quiz/<int:subject_id>", methods=["POST"])
 @login_required
 def submit_quiz(subject_id):
     try:
-        user_answers = request.form
-        correct_answers = {key.replace('correct_answer_', ''): value for key, value in user_answers.items() if key.startswith('correct_answer_')}
-        
-        score = 0
-        total_questions = len(correct_answers)
-        
-        for index, correct_answer in correct_answers.items():
-            user_answer = user_answers.get(f"question_{index}")
-            if user_answer == correct_answer:
-                score += 1
-        
-        quiz_percentage = (score / total_questions) * 100 if total_questions > 0 else 0
+        question_ids = session.pop(f"quiz_{subject_id}", None)
+        if not question_ids:
+            flash("This quiz has expired. Please start a new one.")
+            return redirect(url_for('main.dashboard'))
 
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT progress FROM subjects WHERE id = %s AND user_id = %s", (subject_id, current_user.id))
-        current_progress_result = cur.fetchone()
+        cur.execute("SELECT id, answer FROM quiz_questions WHERE id = ANY(%s)", (question_ids,))
+        correct_answers = dict(cur.fetchall())
+        if not correct_answers:
+            # Every question was removed since the quiz was served (notes regenerated); nothing to grade.
+            flash("This quiz has expired. Please start a new one.")
+            return redirect(url_for('main.dashboard'))
 
-        if current_progress_result is None:
-            flash("Subject not found.")
-            cur.close()
-            conn.close()
-            return redirect(url_for('dashboard'))
+        score = 0
+        # Questions removed since the quiz was served (notes regenerated) are not counted.
+        total_questions = len(correct_answers)
 
-        current_progress = current_progress_result[0]
-        new_progress = min(100, round((current_progress + quiz_percentage) / 2))
-        
-        cur.execute("UPDATE subjects SET progress = %s WHERE id = %s", (new_progress, subject_id))
+        for question_id, correct_answer in correct_answers.items():
+            user_answer = request.form.get(f"question_{question_id}")
+            if user_answer == correct_answer:
+                score += 1
         
+        # The attempt is stored and folded into the subject's aggregate in one statement.
+        summary = progress.record_attempt(cur, current_user.id, subject_id, score, total_questions)
         conn.commit()
         cur.close()
         conn.close()
 
-        flash(f"Quiz submitted! You scored {score}/{total_questions}. Your progress has been updated to {new_progress}%.")
-        return redirect(url_for('dashboard'))
+        if summary is None:
+            flash("Subject not found.")
+            return redirect(url_for('main.dashboard'))
+
+        flash(f"Quiz submitted! You scored {score}/{total_questions}. Your progress has been updated to {summary['progress']}%.")
+        return redirect(url_for('main.dashboard'))
 
     except Exception as e:
         flash(f"An error occurred while submitting your quiz: {str(e)}")
         print(f"Quiz Submission Error: {e}")
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-@app.route("/clear_subjects", methods=['POST'])
+@bp.route("/clear_subjects", methods=['POST'])
 @login_required
 def clear_subjects():
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT id FROM subjects WHERE user_id = %s", (current_user.id,))
-        subject_ids = [item[0] for item in cur.fetchall()]
-        if subject_ids:
-            cur.execute("DELETE FROM topics WHERE subject_id = ANY(%s)", (subject_ids,))
-            cur.execute("DELETE FROM subjects WHERE user_id = %s", (current_user.id,))
+        progress.delete_user_subjects(cur, current_user.id)
         conn.commit()
         cur.close()
         conn.close()
@@ -501,7 +1078,110 @@ def clear_subjects():
     except Exception as e:
         flash(f"An error occurred: {str(e)}")
         print(f"Clear Subjects Error: {e}")
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
+
+# --- Internal stats ---
+# /metrics, /db_pool_stats and /cache_stats expose the worker's pool and cache
+# details. They only answer requests that send STATS_TOKEN, in an
+# X-Stats-Token header or as a bearer token (what Prometheus scrape configs
+# send), and are 404s when it is unset.
+STATS_TOKEN = os.getenv("STATS_TOKEN", "")
+
+def internal_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get("X-Stats-Token", "")
+        authorization = request.headers.get("Authorization", "")
+        if not token and authorization.startswith("Bearer "):
+            token = authorization[len("Bearer "):]
+        if not STATS_TOKEN or not hmac.compare_digest(token.encode("utf-8"), STATS_TOKEN.encode("utf-8")):
+            return jsonify({"error": "Not found"}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
+@bp.route("/metrics")
+@internal_only
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@metrics.register_collector
+def collect_cache_and_pool_metrics():
+    families = []
+    pool = pool_stats()
+    if pool:
+        families += [
+            ("db_pool_connections", "gauge", "Open pooled connections by state.",
+                [({"state": "in_use"}, pool["in_use"]), ({"state": "idle"}, pool["idle"]),
+                 ({"state": "overflow"}, pool["overflow"])]),
+            ("db_pool_checkouts_total", "counter", "Connections handed out by the pool.", [({}, pool["checkouts"])]),
+            ("db_pool_waits_total", "counter", "Checkouts that had to wait for a free connection.", [({}, pool["waits"])]),
+            ("db_pool_wait_seconds_total", "counter", "Total time spent waiting for a connection.",
+                [({}, pool["wait_seconds_total"])]),
+            ("db_pool_timeouts_total", "counter", "Checkouts that gave up waiting.", [({}, pool["timeouts"])]),
+        ]
+    user_stats = user_cache.stats()
+    families.append(("user_cache_requests_total", "counter", "User loader cache lookups by result.",
+        [({"result": "hit"}, user_stats["hits"]), ({"result": "miss"}, user_stats["misses"])]))
+    semantic_stats = semantic_cache.cache_stats()
+    if semantic_stats["enabled"]:
+        families.append(("semantic_cache_requests_total", "counter", "Semantic chat cache lookups by result.",
+            [({"result": "hit"}, semantic_stats["hits"]), ({"result": "miss"}, semantic_stats["misses"])]))
+        families.append(("semantic_cache_entries", "gauge", "Live semantic chat cache entries.",
+            [({}, semantic_stats["size"])]))
+        families.append(("semantic_cache_evictions_total", "counter", "Entries evicted to make room.",
+            [({}, semantic_stats["evictions"])]))
+    limiter_stats = user_limiter.stats()
+    families.append(("user_limit_requests", "gauge", "LLM-bound requests holding or waiting for a per-user slot.",
+        [({"state": "active"}, limiter_stats["requests_active"]),
+         ({"state": "waiting"}, limiter_stats["requests_waiting"])]))
+    render_stats = notes_sections.render_stats()
+    families.append(("notes_sections_total", "counter", "Notes sections prepared, by whether the HTML was rendered or reused.",
+        [({"result": "rendered"}, render_stats["rendered"]), ({"result": "reused"}, render_stats["reused"])]))
+    extraction_stats = extraction.cache_stats()
+    families.append(("extraction_cache_requests_total", "counter", "Extraction cache lookups by result.",
+        [({"result": "hit"}, extraction_stats["hits"]), ({"result": "miss"}, extraction_stats["misses"])]))
+    return families
+
+@bp.route("/db_pool_stats")
+@internal_only
+def db_pool_stats():
+    return jsonify(pool_stats())
+
+@bp.route("/cache_stats")
+@internal_only
+def cache_stats():
+    return jsonify({"extraction": extraction.cache_stats(), "users": user_cache.stats(),
+                    "semantic": semantic_cache.cache_stats(), "notes_sections": notes_sections.render_stats()})
+
+# ---------------- APP FACTORY ----------------
+# Importing this module stays cheap: the PDF/OCR/DOCX extractors, markdown,
+# NumPy and the Groq SDK are imported on first use. With GUNICORN_PRELOAD=1,
+# gunicorn.conf.py calls import_heavy_modules() in the master instead, so
+# every forked worker starts with them already loaded and shares their pages.
+def import_heavy_modules():
+    import docx  # noqa: F401
+    import fitz  # noqa: F401
+    import groq  # noqa: F401
+    import markdown  # noqa: F401
+    import pytesseract  # noqa: F401
+    from PIL import Image  # noqa: F401
+    if semantic_cache.SEMANTIC_CACHE_ENABLED:
+        import numpy  # noqa: F401
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv("FLASK_SECRET_KEY", "a-super-secret-key")
+    # Connections come from a per-process pool configured through DATABASE_URL and
+    # the DB_POOL_* variables (see db.py). Each request checks out at most one
+    # connection and it is always returned when the request ends.
+    db.init_app(app)
+    metrics.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+# `gunicorn app:app` and worker.py use this instance.
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
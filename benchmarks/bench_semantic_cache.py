@@ -0,0 +1,78 @@
+"""Benchmark: semantic chat cache (semantic_cache.py) lookup cost and matching.
+
+Fills a cache with N synthetic prompts and times embedding + nearest-neighbour
+lookup, then prints the similarity of a few prompt pairs against the
+SEMANTIC_CACHE_THRESHOLD so the threshold can be tuned. No database needed.
+
+    python benchmarks/bench_semantic_cache.py --entries 5000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import semantic_cache  # noqa: E402
+
+TOPICS = ["binary search", "linked lists", "normalisation in databases", "TCP handshake", "photosynthesis",
+          "Newton's second law", "recursion", "hash tables", "the French revolution", "supply and demand",
+          "process scheduling", "virtual memory", "gradient descent", "SQL joins", "big O notation"]
+TEMPLATES = ["explain {}", "what is {}?", "give me an example of {}", "summarise {} in three bullet points",
+             "how does {} work", "common exam questions on {}"]
+
+PAIRS = [
+    ("Explain binary search", "explain binary search."),
+    ("What is recursion?", "what's recursion"),
+    ("Explain binary search", "Explain binary search trees"),
+    ("Explain binary search", "Explain linear search"),
+    ("How does virtual memory work", "how does virtual memory work in linux"),
+    ("What is recursion?", "What is a hash table?"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    cache = semantic_cache.SemanticCache(args.entries, semantic_cache.SEMANTIC_CACHE_DIM,
+                                         ttl=3600, threshold=semantic_cache.SEMANTIC_CACHE_THRESHOLD)
+    rng = random.Random(0)
+    prompts = [f"{rng.choice(TEMPLATES).format(rng.choice(TOPICS))} (variant {i})" for i in range(args.entries)]
+    started = time.perf_counter()
+    for prompt in prompts:
+        cache.store(1, semantic_cache.embed_turn(prompt), "answer " * 10)
+    fill = time.perf_counter() - started
+
+    embed_times, lookup_times = [], []
+    for _ in range(args.lookups):
+        prompt = rng.choice(prompts) if rng.random() < 0.5 else rng.choice(TEMPLATES).format(rng.choice(TOPICS))
+        t0 = time.perf_counter()
+        vector = semantic_cache.embed_turn(prompt)
+        t1 = time.perf_counter()
+        cache.lookup(1, vector)
+        t2 = time.perf_counter()
+        embed_times.append(t1 - t0)
+        lookup_times.append(t2 - t1)
+
+    stats = cache.stats()
+    print(f"{args.entries} entries x {semantic_cache.SEMANTIC_CACHE_DIM} dims, filled in {fill:.2f}s")
+    print(f"embed  p50 {statistics.median(embed_times) * 1000:.2f} ms")
+    print(f"lookup p50 {statistics.median(lookup_times) * 1000:.2f} ms, "
+          f"max {max(lookup_times) * 1000:.2f} ms ({stats['hits']} hits / {stats['misses']} misses)")
+    print(f"\nthreshold {semantic_cache.SEMANTIC_CACHE_THRESHOLD}")
+    for a, b in PAIRS:
+        score = float(semantic_cache.embed_turn(a) @ semantic_cache.embed_turn(b))
+        verdict = "hit " if score >= semantic_cache.SEMANTIC_CACHE_THRESHOLD else "miss"
+        print(f"  {verdict} {score:.3f}  {a!r} ~ {b!r}")
+    same, other = (semantic_cache.embed_turn("Explain more", ctx) for ctx in (["Binary search halves the range"],
+                                                                               ["Photosynthesis makes sugar"]))
+    print(f"  {float(same @ other):.3f}  'Explain more' after two unrelated answers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark: how long the app takes to import and how long gunicorn takes to serve.
+
+1. Imports `app` in fresh interpreters with `python -X importtime` and prints
+   the median import time, the slowest top-level imports, and the time for
+   import_heavy_modules() (what every process used to pay when the
+   extractors, markdown, NumPy and the Groq SDK were imported eagerly).
+2. Starts gunicorn with --workers N, with GUNICORN_PRELOAD off and on, and
+   times from launch until /login answers. The Pss column shows the
+   workers' proportional memory after startup. Shared pages are split
+   between the processes that map them, so preloading shows up as a smaller
+   per-worker figure.
+
+    python benchmarks/bench_startup.py --runs 5 --workers 4
+
+Needs DATABASE_URL to be set (the app reads it on first use only; /login
+does not touch the database).
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def import_profile():
+    """Returns ({module: cumulative_us}, app import seconds, heavy-modules seconds) from one fresh interpreter."""
+    code = ("import time; t = time.perf_counter(); import app; a = time.perf_counter() - t; "
+            "t = time.perf_counter(); app.import_heavy_modules(); print(a, time.perf_counter() - t)")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if not match:
+            continue
+        if match.group(3) == "app" and not match.group(2):
+            break  # children are listed before their parent; what follows is import_heavy_modules()
+        # Only modules imported directly by app.py (one level of indentation).
+        if len(match.group(2)) == 2:
+            modules[match.group(3)] = int(match.group(1))
+    app_seconds, heavy_seconds = map(float, result.stdout.split())
+    return modules, app_seconds, heavy_seconds
+
+
+def pss_kib(pid):
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            return int(re.search(r"^Pss:\s+(\d+)", f.read(), re.M).group(1))
+    except (OSError, AttributeError):
+        return None
+
+
+def worker_pids(master_pid):
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def boot(workers, preload, worker_class, port):
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers),
+               GUNICORN_PRELOAD="1" if preload else "0", GUNICORN_WORKER_CLASS=worker_class)
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                if proc.poll() is not None or time.perf_counter() - started > 60:
+                    raise RuntimeError("gunicorn did not come up")
+                time.sleep(0.01)
+        ready = time.perf_counter() - started
+        # Give the remaining workers time to finish booting before measuring memory.
+        deadline = time.monotonic() + 10
+        while len(worker_pids(proc.pid)) < workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(1)
+        pss = [pss_kib(pid) for pid in worker_pids(proc.pid)]
+        return ready, [p for p in pss if p is not None]
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker-class", default="sync", choices=("sync", "gevent"))
+    parser.add_argument("--port", type=int, default=8897)
+    parser.add_argument("--top", type=int, default=8, help="slowest direct imports to list")
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    print(f"import app: median {statistics.median(p[1] for p in profiles) * 1000:.0f} ms over {args.runs} runs; "
+          f"import_heavy_modules() adds {statistics.median(p[2] for p in profiles) * 1000:.0f} ms")
+    modules = profiles[-1][0]
+    for name, micros in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {micros / 1000:>7.1f} ms  {name}")
+
+    print(f"\ngunicorn, {args.workers} {args.worker_class} workers")
+    print(f"{'preload':>8} | {'ready s (median)':>16} | {'Pss/worker MiB':>14}")
+    for preload in (False, True):
+        results = [boot(args.workers, preload, args.worker_class, args.port) for _ in range(args.runs)]
+        ready = statistics.median(r[0] for r in results)
+        pss = [sum(r[1]) / len(r[1]) for r in results if r[1]]
+        pss_text = f"{statistics.median(pss) / 1024:>14.1f}" if pss else f"{'n/a':>14}"
+        print(f"{'on' if preload else 'off':>8} | {ready:>16.2f} | {pss_text}")
+
+
+if __name__ == "__main__":
+    main()
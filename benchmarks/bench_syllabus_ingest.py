@@ -0,0 +1,92 @@
+"""Benchmark: row-by-row vs bulk syllabus ingestion (round trips and wall time)."""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import syllabus  # noqa: E402
+
+# Compares the old row-by-row syllabus insert with syllabus.insert_syllabus().
+# Every run happens inside a transaction that is rolled back, so the database
+# is left untouched. Needs DATABASE_URL with the app schema applied.
+#
+#   python benchmarks/bench_syllabus_ingest.py --sizes 5,20,50,100 --topics 12
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    round_trips = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.round_trips += 1
+        return super().execute(query, vars)
+
+
+def make_syllabus(subject_count, topic_count):
+    return {"subjects": [
+        {"name": f"Subject {i}", "topics": [f"Unit {i}.{j}" for j in range(topic_count)]}
+        for i in range(subject_count)
+    ]}
+
+
+def insert_row_by_row(cur, user_id, filename, parsed_data):
+    # The original upload_syllabus loop, kept here as the baseline.
+    cur.execute("INSERT INTO syllabuses (user_id, filename, parsed_content) VALUES (%s, %s, %s) RETURNING id",
+        (user_id, filename, json.dumps(parsed_data)))
+    syllabus_id = cur.fetchone()[0]
+    for subject_data in parsed_data.get("subjects", []):
+        cur.execute("INSERT INTO subjects (syllabus_id, user_id, name) VALUES (%s, %s, %s) RETURNING id",
+            (syllabus_id, user_id, subject_data.get("name")))
+        subject_id = cur.fetchone()[0]
+        for topic_name in subject_data.get("topics", []):
+            cur.execute("INSERT INTO topics (subject_id, name) VALUES (%s, %s)", (subject_id, topic_name))
+    return syllabus_id
+
+
+def run(conn, insert, parsed_data, repeat):
+    timings = []
+    for _ in range(repeat):
+        with conn.cursor(cursor_factory=CountingCursor) as cur:
+            cur.execute("INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id",
+                (f"bench-{time.time_ns()}", "x"))
+            user_id = cur.fetchone()[0]
+            CountingCursor.round_trips = 0
+            started = time.perf_counter()
+            insert(cur, user_id, "bench.pdf", parsed_data)
+            timings.append(time.perf_counter() - started)
+            round_trips = CountingCursor.round_trips
+        conn.rollback()
+    timings.sort()
+    return round_trips, timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="5,20,50,100", help="comma separated subject counts")
+    parser.add_argument("--topics", type=int, default=12, help="topics per subject")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    print(f"{'subjects':>8} {'topics':>7} | {'row-by-row':>22} | {'bulk':>22} | speedup")
+    print(f"{'':>8} {'':>7} | {'trips':>8} {'median ms':>13} | {'trips':>8} {'median ms':>13} |")
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            parsed_data = make_syllabus(size, args.topics)
+            old_trips, old_time = run(conn, insert_row_by_row, parsed_data, args.repeat)
+            new_trips, new_time = run(conn, syllabus.insert_syllabus, parsed_data, args.repeat)
+            print(f"{size:>8} {size * args.topics:>7} | {old_trips:>8} {old_time * 1000:>13.1f} | "
+                  f"{new_trips:>8} {new_time * 1000:>13.1f} | {old_time / new_time:>6.1f}x")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark: /get_conversations throughput with and without the user cache.
+
+Runs the app in-process with Flask's test client against DATABASE_URL (so it
+measures server-side cost only, without HTTP overhead) and reports
+requests/sec and pool checkouts per request. Creates one throwaway user.
+
+    python benchmarks/bench_user_loader.py --requests 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as app_module  # noqa: E402
+
+
+def run(client, requests):
+    before = app_module.pool_stats().get("checkouts", 0)
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get("/get_conversations")
+        assert response.status_code == 200, response.status_code
+    elapsed = time.perf_counter() - started
+    checkouts = app_module.pool_stats().get("checkouts", 0) - before
+    return requests / elapsed, checkouts / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    client = app_module.app.test_client()
+    client.post("/register", data={"username": f"bench-{uuid.uuid4().hex[:12]}", "password": "bench"})
+    run(client, 50)  # warm up the pool and caches
+
+    ttl = app_module.USER_CACHE_TTL
+    app_module.USER_CACHE_TTL = 0
+    app_module.user_cache.ttl = 0
+    app_module.user_cache.clear()
+    off_rps, off_checkouts = run(client, args.requests)
+
+    app_module.USER_CACHE_TTL = ttl
+    app_module.user_cache.ttl = ttl
+    on_rps, on_checkouts = run(client, args.requests)
+
+    print(f"{'user cache':>10} | {'req/s':>8} | {'pool checkouts/req':>18}")
+    print(f"{'off':>10} | {off_rps:>8.0f} | {off_checkouts:>18.2f}")
+    print(f"{'on':>10} | {on_rps:>8.0f} | {on_checkouts:>18.2f}")
+    print(f"speedup: {on_rps / off_rps:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""A local stand-in for the Groq chat completions API, for load tests.
+
+Speaks the OpenAI-compatible endpoint the Groq SDK uses
+(POST /openai/v1/chat/completions), with configurable latency and token rate,
+streaming, JSON mode and injected failures (a share of requests, or every
+request for some models, answered with an error status and optional
+Retry-After). Point the app at it with:
+
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=fake
+
+    python benchmarks/fake_groq.py --port 8765 --latency 0.8 --tokens-per-second 150
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOREM = ("Sure. Here is a concise explanation of the topic you asked about, covering the key "
+         "ideas, a worked example and the most common pitfalls to watch out for. ").split()
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeGroq/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        config = self.server.config
+        with self.server.lock:
+            self.server.requests += 1
+
+        if request.get("model") in config.failing_models or random.random() < config.error_rate:
+            self._send_error(config)
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in request.get("messages", []))
+        tokens = self._completion_tokens(request, config.completion_tokens)
+        time.sleep(config.latency)
+
+        if request.get("stream"):
+            self._stream(request, tokens, prompt_tokens, config)
+            return
+
+        if config.tokens_per_second:
+            time.sleep(len(tokens) / config.tokens_per_second)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake-model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                      "total_tokens": prompt_tokens + len(tokens)},
+        })
+
+    def _send_error(self, config):
+        body = json.dumps({"error": {"message": f"injected failure ({config.error_status})",
+                                     "type": "server_error"}}).encode("utf-8")
+        self.send_response(config.error_status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if config.retry_after is not None:
+            self.send_header("Retry-After", str(config.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _completion_tokens(self, request, count):
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            return [json.dumps(self._json_answer(request))]
+        return [LOREM[i % len(LOREM)] + " " for i in range(count)]
+
+    def _json_answer(self, request):
+        prompt = json.dumps(request.get("messages", []))
+        if "mcqs" in prompt:
+            return {"mcqs": [{"question": f"Question {i}?", "options": ["A", "B", "C", "D"], "answer": "A"}
+                             for i in range(10)]}
+        return {"subjects": [{"name": f"Subject {i}", "topics": [f"Topic {i}.{j}" for j in range(5)]}
+                             for i in range(4)]}
+
+    def _stream(self, request, tokens, prompt_tokens, config):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second else 0
+
+        def write_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        for i, token in enumerate(tokens):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "fake-model"),
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            if i == len(tokens) - 1:
+                chunk["choices"][0]["finish_reason"] = "stop"
+                chunk["x_groq"] = {"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                                             "total_tokens": prompt_tokens + len(tokens)}}
+            write_event(json.dumps(chunk))
+            if delay:
+                time.sleep(delay)
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeGroqConfig:
+    def __init__(self, latency=0.5, tokens_per_second=200.0, completion_tokens=120,
+                 error_rate=0.0, error_status=503, retry_after=None, failing_models=()):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.failing_models = set(failing_models)
+
+
+def make_server(host="127.0.0.1", port=0, config=None):
+    server = ThreadingHTTPServer((host, port), FakeGroqHandler)
+    server.daemon_threads = True
+    server.config = config or FakeGroqConfig()
+    server.lock = threading.Lock()
+    server.requests = 0
+    return server
+
+
+def start_server(host="127.0.0.1", port=0, config=None):
+    """Starts the fake server on a background thread and returns it (server.server_port)."""
+    server = make_server(host, port, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with errors")
+    parser.add_argument("--failing-models", default="", help="comma separated models that always fail")
+    args = parser.parse_args()
+
+    config = FakeGroqConfig(args.latency, args.tokens_per_second, args.completion_tokens,
+                            args.error_rate, args.error_status, args.retry_after,
+                            [m for m in args.failing_models.split(",") if m])
+    server = make_server(args.host, args.port, config)
+    print(f"Fake Groq listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency}s, {args.tokens_per_second} tok/s)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
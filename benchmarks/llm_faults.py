@@ -0,0 +1,71 @@
+"""Fault drill for the LLM gateway (llm.py) against the fake Groq server.
+
+Runs the same batch of completions through llm.complete() while the fake
+server is healthy, flaky, throttling, missing the large model and fully down,
+and prints how many calls succeeded, how long they took and how many requests
+actually reached the "API". No database or API key needed.
+
+    python benchmarks/llm_faults.py --calls 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+import fake_groq  # noqa: E402
+
+SCENARIOS = [
+    ("healthy", {}),
+    ("30% 503", {"error_rate": 0.3, "error_status": 503}),
+    ("30% 429 + Retry-After 1s", {"error_rate": 0.3, "error_status": 429, "retry_after": 1}),
+    ("large model down", {"failing_models": "LARGE"}),
+    ("full outage", {"error_rate": 1.0, "error_status": 503}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Groq seconds per completion")
+    parser.add_argument("--timeout", type=float, default=10, help="deadline per call")
+    args = parser.parse_args()
+
+    server = fake_groq.start_server(config=fake_groq.FakeGroqConfig(latency=args.latency, tokens_per_second=0))
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+    import llm
+
+    messages = [{"role": "user", "content": "Explain recursion in one paragraph."}]
+    print(f"{args.calls} calls to {llm.GROQ_MODEL_LARGE} per scenario (fallback: {llm.FALLBACK_MODELS or 'none'})")
+    print(f"{'scenario':>26} | {'ok':>3} {'failed':>6} | {'p50 s':>6} {'max s':>6} | {'upstream reqs':>13} | breaker")
+    for name, overrides in SCENARIOS:
+        overrides = dict(overrides)
+        if overrides.get("failing_models") == "LARGE":
+            overrides["failing_models"] = [llm.GROQ_MODEL_LARGE]
+        server.config = fake_groq.FakeGroqConfig(latency=args.latency, tokens_per_second=0, **overrides)
+        llm._breakers.clear()
+        before = server.requests
+
+        ok, failed, latencies = 0, 0, []
+        for _ in range(args.calls):
+            started = time.perf_counter()
+            try:
+                llm.complete(llm.GROQ_MODEL_LARGE, messages, timeout=args.timeout)
+                ok += 1
+            except llm.LLMError:
+                failed += 1
+            latencies.append(time.perf_counter() - started)
+
+        states = ", ".join(f"{model}={state}" for model, state in llm.breaker_states().items())
+        print(f"{name:>26} | {ok:>3} {failed:>6} | {statistics.median(latencies):>6.2f} {max(latencies):>6.2f} | "
+              f"{server.requests - before:>13} | {states}")
+
+
+if __name__ == "__main__":
+    main()
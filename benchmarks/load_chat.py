@@ -0,0 +1,155 @@
+"""Load test: concurrent /chat conversations served by ONE gunicorn worker process.
+
+Starts the fake Groq server (benchmarks/fake_groq.py), then for each worker
+class starts `gunicorn -w 1 -k <class>` and drives N simultaneous
+conversations against it. The table shows how many conversations a single
+process can carry before latency collapses. Needs DATABASE_URL with the
+migrations applied; it creates throwaway users named loadtest-*.
+
+    python benchmarks/load_chat.py --worker-classes sync,gevent --concurrency 1,10,50 --turns 3
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+import fake_groq  # noqa: E402
+
+
+class Client:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def post(self, path, fields, timeout=300):
+        data = urllib.parse.urlencode(fields).encode("utf-8")
+        with self.opener.open(self.base_url + path, data=data, timeout=timeout) as response:
+            return response.status, response.read()
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/login", timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"app did not start at {base_url}")
+
+
+def run_conversations(base_url, concurrency, turns, stream):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency)
+
+    def conversation():
+        client = Client(base_url)
+        username = f"loadtest-{uuid.uuid4().hex[:12]}"
+        try:
+            client.post("/register", {"username": username, "password": "loadtest"})
+        except Exception as e:
+            with lock:
+                errors.append(f"register: {e}")
+            barrier.abort()
+            return
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            return
+        conversation_id = ""
+        for turn in range(turns):
+            fields = {"message": f"Explain topic {turn} in simple terms.", "conversation_id": conversation_id}
+            if stream:
+                fields["stream"] = "1"
+            started = time.perf_counter()
+            try:
+                status, body = client.post("/chat", fields)
+                elapsed = time.perf_counter() - started
+                if not conversation_id:
+                    if stream:
+                        meta = body.split(b"\n\n", 1)[0].split(b"data: ", 1)[1]
+                        conversation_id = str(json.loads(meta)["conversation_id"])
+                    else:
+                        conversation_id = str(json.loads(body)["conversation_id"])
+                with lock:
+                    latencies.append(elapsed)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+
+    threads = [threading.Thread(target=conversation) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return latencies, errors, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-classes", default="sync,gevent")
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake Groq seconds per completion")
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--stream", action="store_true", help="use the SSE /chat mode")
+    parser.add_argument("--port", type=int, default=8899)
+    args = parser.parse_args()
+
+    groq = fake_groq.start_server(config=fake_groq.FakeGroqConfig(
+        latency=args.llm_latency, tokens_per_second=args.tokens_per_second, completion_tokens=60))
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ,
+               GROQ_BASE_URL=f"http://127.0.0.1:{groq.server_port}",
+               GROQ_API_KEY=os.getenv("GROQ_API_KEY", "fake"),
+               PORT=str(args.port), WEB_CONCURRENCY="1",
+               # The fake server has no quota; measure the app, not our own throttle.
+               LLM_REQUESTS_PER_MINUTE=os.getenv("LLM_REQUESTS_PER_MINUTE", "0"),
+               # Enough pooled connections that the pool is not what we measure.
+               DB_POOL_MAX=os.getenv("DB_POOL_MAX", "20"))
+
+    print(f"fake LLM latency {args.llm_latency}s, {args.turns} turns per conversation, 1 worker process")
+    print(f"{'worker':>8} {'convs':>6} | {'turns/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} | errors")
+    for worker_class in args.worker_classes.split(","):
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-k", worker_class, "app:app"],
+            cwd=ROOT, env=dict(env, GUNICORN_WORKER_CLASS=worker_class),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(base_url)
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                latencies, errors, wall = run_conversations(base_url, concurrency, args.turns, args.stream)
+                print(f"{worker_class:>8} {concurrency:>6} | {len(latencies) / wall:>8.2f} "
+                      f"{statistics.median(latencies) if latencies else float('nan'):>7.2f} "
+                      f"{percentile(latencies, 95):>7.2f} {percentile(latencies, 99):>7.2f} | {len(errors)}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
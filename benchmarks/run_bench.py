@@ -0,0 +1,332 @@
+"""End-to-end benchmark: a realistic request mix against the app, with no real LLM.
+
+Starts the fake Groq server (benchmarks/fake_groq.py), one gunicorn worker
+running app:app and one `worker.py` job worker, all against DATABASE_URL.
+Each virtual user registers, uploads a syllabus and waits for its notes and
+quiz bank. Then --users virtual users send a weighted mix of requests for
+--duration seconds. The report per operation gives requests/s, p50/p95/p99
+latency, errors and database round trips per request (read from the
+app's /metrics). Results can be saved and compared between commits:
+
+    python benchmarks/run_bench.py --users 20 --duration 60 --output before.json
+    git checkout my-branch
+    python benchmarks/run_bench.py --users 20 --duration 60 --output after.json --compare before.json
+
+Needs the migrations applied; creates throwaway users named bench-*.
+"""
+
+import argparse
+import datetime
+import http.cookiejar
+import json
+import os
+import random
+import re
+import secrets
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+import fake_groq  # noqa: E402
+from load_chat import percentile, wait_until_up  # noqa: E402
+
+DEFAULT_MIX = "chat=35,chat_stream=15,chat_file=5,get_conversations=25,view_notes=10,generate_quiz=10"
+# Flask endpoint that serves each operation, for looking up its /metrics series.
+ENDPOINTS = {"chat": "chat", "chat_stream": "chat", "chat_file": "chat",
+             "get_conversations": "get_conversations", "view_notes": "view_notes",
+             "generate_quiz": "generate_quiz"}
+QUESTIONS = ["Explain {} with an example.", "What are common mistakes with {}?",
+             "Summarise {} in five bullet points.", "How is {} used in practice?"]
+TOPICS = ["binary search", "normal forms", "TCP congestion control", "recursion", "hash tables",
+          "process scheduling", "virtual memory", "SQL joins"]
+
+
+def make_pdf(title, pages=3):
+    import fitz  # PyMuPDF, already an app dependency
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"{title} - page {i + 1}", fontsize=14)
+        body = " ".join(f"{topic} is covered in unit {j}." for j, topic in enumerate(TOPICS))
+        page.insert_textbox(fitz.Rect(72, 100, 520, 760), body * 4, fontsize=10)
+    return doc.tobytes()
+
+
+class Client:
+    """Cookie-keeping HTTP client; returns (status, body) and never raises on HTTP errors."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, fields=None, files=None, headers=None, timeout=300):
+        data = None
+        headers = dict(headers or {})
+        if files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for name, value in (fields or {}).items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+            for name, (filename, content) in files.items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                             f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b"\r\n")
+            data = b"".join(parts) + f"--{boundary}--\r\n".encode()
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        elif fields is not None:
+            data = urllib.parse.urlencode(fields).encode("utf-8")
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with self.opener.open(req, timeout=timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class VirtualUser:
+    def __init__(self, base_url, conn):
+        self.client = Client(base_url)
+        self.username = f"bench-{uuid.uuid4().hex[:12]}"
+        self.conn = conn
+        self.conversation_id = ""
+        self.subject_ids = []
+        self.pdf = make_pdf(f"Lecture notes for {self.username}", pages=5)
+
+    def setup(self, timeout):
+        self.client.request("POST", "/register", {"username": self.username, "password": "bench"})
+        self.client.request("POST", "/upload_syllabus",
+                            files={"syllabus_file": ("syllabus.pdf", make_pdf("Syllabus"))})
+        deadline = time.monotonic() + timeout
+        while not self.subject_ids:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{self.username}: syllabus was not processed; is worker.py running?")
+            time.sleep(0.5)
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT s.id FROM subjects s JOIN users u ON u.id = s.user_id "
+                            "WHERE u.username = %s ORDER BY s.id", (self.username,))
+                self.subject_ids = [row[0] for row in cur.fetchall()]
+            self.conn.rollback()
+        # Notes and the quiz bank are generated in the background; wait until both are served.
+        for method, path, ready in (("GET", f"/view_notes/{self.subject_ids[0]}", b"notes-content"),
+                                    ("POST", f"/generate_quiz/{self.subject_ids[0]}", b'name="question_')):
+            while ready not in self.client.request(method, path)[1]:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{self.username}: {path} never became ready")
+                time.sleep(1)
+
+    def run(self, op):
+        question = random.choice(QUESTIONS).format(random.choice(TOPICS))
+        if op in ("chat", "chat_stream", "chat_file"):
+            fields = {"message": question, "conversation_id": self.conversation_id}
+            if op == "chat_stream":
+                fields["stream"] = "1"
+            files = {"file": ("notes.pdf", self.pdf)} if op == "chat_file" else None
+            status, body = self.client.request("POST", "/chat", fields, files=files)
+            if status == 200 and not self.conversation_id:
+                match = re.search(rb'"conversation_id":\s*(\d+)', body)
+                self.conversation_id = match.group(1).decode() if match else ""
+            ok = status == 200 and b'"error"' not in body
+            return ok, status
+        if op == "get_conversations":
+            status, _ = self.client.request("GET", "/get_conversations")
+        elif op == "view_notes":
+            status, _ = self.client.request("GET", f"/view_notes/{random.choice(self.subject_ids)}")
+        elif op == "generate_quiz":
+            status, _ = self.client.request("POST", f"/generate_quiz/{self.subject_ids[0]}")
+        else:
+            raise ValueError(f"unknown operation {op}")
+        return status == 200, status
+
+
+def scrape_round_trips(base_url, stats_token):
+    """Returns {endpoint: (sum, count)} of app_request_db_round_trips from /metrics."""
+    scrape = urllib.request.Request(base_url + "/metrics", headers={"X-Stats-Token": stats_token})
+    with urllib.request.urlopen(scrape, timeout=10) as response:
+        text = response.read().decode("utf-8")
+    totals = {}
+    for kind, route, value in re.findall(r'^app_request_db_round_trips_(sum|count)\{route="([^"]+)"\} (\S+)$',
+                                         text, re.M):
+        entry = totals.setdefault(route, [0.0, 0.0])
+        entry[0 if kind == "sum" else 1] = float(value)
+    return {route: tuple(values) for route, values in totals.items()}
+
+
+def run_mix(users, mix, duration):
+    ops, weights = zip(*mix.items())
+    samples = {op: [] for op in ops}
+    errors = {op: 0 for op in ops}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def loop(user):
+        while time.monotonic() < stop_at:
+            op = random.choices(ops, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok, _ = user.run(op)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[op].append(elapsed)
+                if not ok:
+                    errors[op] += 1
+
+    threads = [threading.Thread(target=loop, args=(user,)) for user in users]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors, time.perf_counter() - started
+
+
+def summarise(samples, errors, wall, round_trips):
+    ops = {}
+    for op, latencies in samples.items():
+        endpoint_sum, endpoint_count = round_trips.get(ENDPOINTS[op], (0.0, 0.0))
+        ops[op] = {
+            "requests": len(latencies),
+            "errors": errors[op],
+            "rps": len(latencies) / wall,
+            "p50": statistics.median(latencies) if latencies else None,
+            "p95": percentile(latencies, 95) if latencies else None,
+            "p99": percentile(latencies, 99) if latencies else None,
+            # Per endpoint, so the three chat operations share one figure.
+            "db_round_trips": endpoint_sum / endpoint_count if endpoint_count else None,
+        }
+    everything = [x for latencies in samples.values() for x in latencies]
+    total = {"requests": len(everything), "errors": sum(errors.values()), "rps": len(everything) / wall,
+             "p50": statistics.median(everything) if everything else None,
+             "p95": percentile(everything, 95) if everything else None,
+             "p99": percentile(everything, 99) if everything else None}
+    return ops, total
+
+
+def fmt(value, spec):
+    return format(value, spec) if value is not None else "-".rjust(int(spec.split(".")[0].lstrip(">") or 0))
+
+
+def print_report(ops, total, baseline=None):
+    print(f"{'operation':>18} | {'reqs':>6} {'err':>4} {'rps':>7} | {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} | {'db rt/req':>9}")
+    rows = list(ops.items()) + [("TOTAL", total)]
+    for op, r in rows:
+        print(f"{op:>18} | {r['requests']:>6} {r['errors']:>4} {r['rps']:>7.2f} | {fmt(r['p50'], '>7.3f')} "
+              f"{fmt(r['p95'], '>7.3f')} {fmt(r['p99'], '>7.3f')} | {fmt(r.get('db_round_trips'), '>9.1f')}")
+        if baseline is not None:
+            base = baseline["total"] if op == "TOTAL" else baseline["ops"].get(op)
+            if base:
+                print(f"{'vs baseline':>18} | {'':>6} {'':>4} {change(r['rps'], base['rps']):>7} | "
+                      f"{change(r['p50'], base['p50']):>7} {change(r['p95'], base['p95']):>7} "
+                      f"{change(r['p99'], base['p99']):>7} | "
+                      f"{change(r.get('db_round_trips'), base.get('db_round_trips')):>9}")
+
+
+def change(new, old):
+    if new is None or not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. chat=50,view_notes=50")
+    parser.add_argument("--worker-class", default="gevent", choices=("sync", "gevent"))
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake Groq seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--port", type=int, default=8898)
+    parser.add_argument("--setup-timeout", type=float, default=180)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to diff against")
+    args = parser.parse_args()
+
+    import psycopg2
+    database_url = os.environ["DATABASE_URL"]
+    mix = {op: float(weight) for op, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+    random.seed(args.seed)
+
+    groq = fake_groq.start_server(config=fake_groq.FakeGroqConfig(
+        latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens))
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ,
+               GROQ_BASE_URL=f"http://127.0.0.1:{groq.server_port}",
+               GROQ_API_KEY=os.getenv("GROQ_API_KEY", "fake"),
+               PORT=str(args.port), WEB_CONCURRENCY="1", GUNICORN_WORKER_CLASS=args.worker_class,
+               JOBS_INLINE="0",
+               # The fake server has no quota; measure the app, not our own throttle.
+               LLM_REQUESTS_PER_MINUTE=os.getenv("LLM_REQUESTS_PER_MINUTE", "0"),
+               DB_POOL_MAX=os.getenv("DB_POOL_MAX", "20"),
+               STATS_TOKEN=os.getenv("STATS_TOKEN") or secrets.token_hex(16))
+    web = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                           cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    worker = subprocess.Popen([sys.executable, "worker.py"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    conn = psycopg2.connect(database_url)
+    try:
+        wait_until_up(base_url)
+        print(f"setting up {args.users} users (syllabus, notes, quiz bank)...")
+        users = [VirtualUser(base_url, conn) for _ in range(args.users)]
+        for user in users:
+            user.setup(args.setup_timeout)
+
+        before = scrape_round_trips(base_url, env["STATS_TOKEN"])
+        requests_before = groq.requests
+        print(f"running {args.duration:.0f}s: {args.users} users, {args.worker_class} worker, "
+              f"fake LLM {args.llm_latency}s + {args.completion_tokens} tokens at {args.tokens_per_second}/s")
+        samples, errors, wall = run_mix(users, mix, args.duration)
+        after = scrape_round_trips(base_url, env["STATS_TOKEN"])
+        round_trips = {route: (after[route][0] - before.get(route, (0, 0))[0],
+                               after[route][1] - before.get(route, (0, 0))[1]) for route in after}
+    finally:
+        conn.close()
+        for proc in (web, worker):
+            proc.terminate()
+            proc.wait()
+
+    ops, total = summarise(samples, errors, wall, round_trips)
+    results = {
+        "meta": {"commit": git_commit(), "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "llm_requests": groq.requests - requests_before, "wall_seconds": wall,
+                 "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")}},
+        "ops": ops,
+        "total": total,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"baseline: commit {baseline['meta'].get('commit')} ({baseline['meta'].get('date')})")
+    print_report(ops, total, baseline)
+    print(f"LLM requests during the run: {results['meta']['llm_requests']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import os
+import secrets
+import threading
+import time
+
+import psycopg2.extensions
+from flask import has_app_context
+
+import db
+import metrics
+
+# ---------------- PER-USER LIMITS ----------------
+# UserLimiter caps how many LLM-bound requests one user can have running at
+# once (USER_MAX_CONCURRENT). A few more may wait for a slot
+# (USER_MAX_QUEUED, at most USER_QUEUE_TIMEOUT seconds). Anything beyond that
+# is refused with TooManyRequests, which routes turn into a 429 with
+# Retry-After. One user therefore cannot occupy every worker and pooled
+# connection.
+#
+# Slots live in the user_request_slots table so the cap holds across every
+# web process, sync or gevent. Slots 0..USER_MAX_CONCURRENT-1 are running
+# requests; the next USER_MAX_QUEUED numbers are places in the queue, whose
+# holders poll for a running slot every USER_QUEUE_POLL seconds. Each slot
+# is a lease: a slot left behind by a killed worker is reclaimed after
+# USER_SLOT_LEASE seconds, by default gunicorn's request timeout. Slots are
+# claimed and released on the request's own pooled connection.
+#
+# The defaults follow the gunicorn settings (gunicorn.conf.py). With sync
+# workers a user may run on at most half of WEB_CONCURRENCY workers, and
+# nothing is queued: a queued request would sit in a worker doing nothing.
+# Gevent workers serve many requests each, so 2 running plus 2 queued is safe.
+_SYNC_WORKERS = os.getenv("GUNICORN_WORKER_CLASS", "sync") == "sync"
+_DEFAULT_MAX_CONCURRENT = max(1, int(os.getenv("WEB_CONCURRENCY", "2")) // 2) if _SYNC_WORKERS else 2
+USER_MAX_CONCURRENT = int(os.getenv("USER_MAX_CONCURRENT", str(_DEFAULT_MAX_CONCURRENT)))
+USER_MAX_QUEUED = 0 if _SYNC_WORKERS else int(os.getenv("USER_MAX_QUEUED", "2"))
+USER_QUEUE_TIMEOUT = float(os.getenv("USER_QUEUE_TIMEOUT", "10"))
+USER_QUEUE_POLL = float(os.getenv("USER_QUEUE_POLL", "0.25"))
+USER_SLOT_LEASE = int(os.getenv("USER_SLOT_LEASE", os.getenv("GUNICORN_TIMEOUT", "120")))
+
+USER_LIMIT_REJECTED = metrics.Counter("user_limit_rejected_total",
+    "LLM-bound requests refused by the per-user concurrency limit.", ("route", "reason"))
+USER_LIMIT_QUEUED = metrics.Counter("user_limit_queued_total",
+    "LLM-bound requests that had to wait for one of the user's slots.", ("route",))
+
+
+class TooManyRequests(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A held per-user slot; release() is idempotent so it can be tied to several cleanup paths.
+
+    If releasing fails the slot stays held, and its lease frees it later.
+    """
+
+    def __init__(self, limiter, user_id, number, token):
+        self._limiter = limiter
+        self._user_id = user_id
+        self._number = number
+        self._token = token
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._limiter._release(self._user_id, self._number, self._token)
+            self._released = True
+
+
+class UserLimiter:
+    def __init__(self, max_concurrent=USER_MAX_CONCURRENT, max_queued=USER_MAX_QUEUED,
+                 queue_timeout=USER_QUEUE_TIMEOUT, poll_interval=USER_QUEUE_POLL, lease=USER_SLOT_LEASE):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.poll_interval = poll_interval
+        self.lease = lease
+        # Requests of this process holding or waiting for a slot, for /metrics.
+        self._active = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id, route="unknown"):
+        """Returns a Slot, waiting up to queue_timeout for one; raises TooManyRequests otherwise."""
+        token = secrets.token_hex(8)
+        number = self._claim(user_id, 0, self.max_concurrent, token)
+        if number is not None:
+            self._count(active=1)
+            return Slot(self, user_id, number, token)
+
+        place = self._claim(user_id, self.max_concurrent, self.max_queued, token)
+        if place is None:
+            USER_LIMIT_REJECTED.inc(route=route, reason="queue_full")
+            raise TooManyRequests("Too many requests in progress", retry_after=self.queue_timeout / 2)
+        USER_LIMIT_QUEUED.inc(route=route)
+        self._count(waiting=1)
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    USER_LIMIT_REJECTED.inc(route=route, reason="timeout")
+                    raise TooManyRequests("Timed out waiting for a free slot", retry_after=self.queue_timeout)
+                time.sleep(min(self.poll_interval, remaining))
+                number = self._claim(user_id, 0, self.max_concurrent, token, give_up=place, put_back=True)
+                if number is not None:
+                    place = None
+                    self._count(active=1)
+                    return Slot(self, user_id, number, token)
+        finally:
+            self._count(waiting=-1)
+            if place is not None:
+                self._release(user_id, place, token, active=False)
+
+    def _count(self, active=0, waiting=0):
+        with self._lock:
+            self._active += active
+            self._waiting += waiting
+
+    def _execute(self, sql, params, put_back=False):
+        """Runs one statement in its own transaction on the request's connection.
+
+        Using the request's connection means the limiter never waits for a
+        second one from the pool. It stays checked out for the view unless
+        put_back is set (while queued). Outside a request it is always put back.
+        """
+        conn = db.get_db_connection()
+        try:
+            # Only a failed request leaves work uncommitted here; returning the
+            # connection to the pool would roll it back all the same.
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                row = cur.fetchone() if cur.description else None
+            conn.commit()
+            return row
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if put_back or not has_app_context():
+                conn.close()
+
+    def _claim(self, user_id, first, count, token, give_up=None, put_back=False):
+        """Takes the lowest free (or expired) slot in first..first+count-1 and returns its number, or None.
+
+        give_up is a queue place released in the same transaction when a slot is taken.
+        """
+        if count <= 0:
+            return None
+        # Two requests can pick the same free slot; the loser's upsert matches
+        # a live row and claims nothing, so it looks again.
+        for _ in range(3):
+            number, found = self._execute("""
+                WITH candidate AS (
+                    SELECT n FROM generate_series(%(first)s, %(last)s) n
+                    WHERE NOT EXISTS (SELECT 1 FROM user_request_slots
+                                      WHERE user_id = %(user_id)s AND slot = n AND expires_at > NOW())
+                    ORDER BY n LIMIT 1
+                ),
+                claimed AS (
+                    INSERT INTO user_request_slots AS s (user_id, slot, token, expires_at)
+                    SELECT %(user_id)s, n, %(token)s, NOW() + make_interval(secs => %(lease)s) FROM candidate
+                    ON CONFLICT (user_id, slot) DO UPDATE
+                    SET token = EXCLUDED.token, expires_at = EXCLUDED.expires_at
+                    WHERE s.expires_at <= NOW()
+                    RETURNING slot
+                ),
+                given_up AS (
+                    DELETE FROM user_request_slots
+                    WHERE user_id = %(user_id)s AND slot = %(give_up)s AND token = %(token)s
+                      AND EXISTS (SELECT 1 FROM claimed)
+                )
+                SELECT (SELECT slot FROM claimed), EXISTS (SELECT 1 FROM candidate)
+            """, {"user_id": user_id, "token": token, "lease": self.lease, "first": first,
+                  "last": first + count - 1, "give_up": -1 if give_up is None else give_up}, put_back=put_back)
+            if number is not None or not found:
+                return number
+        return None
+
+    def _release(self, user_id, number, token, active=True):
+        self._execute("DELETE FROM user_request_slots WHERE user_id = %s AND slot = %s AND token = %s",
+                      (user_id, number, token))
+        if active:
+            self._count(active=-1)
+
+    def stats(self):
+        with self._lock:
+            return {"requests_active": self._active, "requests_waiting": self._waiting}
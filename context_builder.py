@@ -0,0 +1,131 @@
+import os
+
+# ---------------- CONTEXT WINDOW CONFIG ----------------
+# /chat never sends the whole conversation to the model. It sends:
+#   system prompt + rolling summary of older turns + the most recent messages
+# trimmed to the model's token budget. Once CONTEXT_SUMMARY_BATCH messages have
+# piled up behind the recent window, a background job folds them into the
+# stored summary, oldest first, one summary call per batch; the turn itself
+# makes no summary call. A longer backlog (conversations from before
+# summaries existed) is folded CONTEXT_SUMMARY_MAX_BATCHES batches per job,
+# and later turns queue more jobs until it is gone, so no message is ever
+# skipped.
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "12"))
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "8"))
+CONTEXT_SUMMARY_MAX_BATCHES = int(os.getenv("CONTEXT_SUMMARY_MAX_BATCHES", "3"))
+CONTEXT_RESPONSE_TOKENS = int(os.getenv("CONTEXT_RESPONSE_TOKENS", "1024"))
+SUMMARY_MESSAGE_CHARS = 2000
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English text; good enough for budgeting.
+    return len(text or "") // 4 + 4
+
+
+class ConversationContext:
+    def __init__(self, conversation_id, summary, summarized_through_id, recent, fold):
+        self.conversation_id = conversation_id
+        self.summary = summary
+        self.summarized_through_id = summarized_through_id
+        self.recent = recent    # [(id, sender, message)] oldest first
+        self.fold = fold        # older messages due to be folded into the summary
+
+
+def load_context(cur, conversation_id, user_id):
+    """Loads the stored summary and only the messages written after it.
+
+    Returns None when the conversation does not exist or belongs to another
+    user, so the ownership check costs no extra round trip.
+    """
+    cur.execute(
+        "SELECT COALESCE(s.summary, ''), COALESCE(s.summarized_through_id, 0) FROM conversations c "
+        "LEFT JOIN conversation_summaries s ON s.conversation_id = c.id "
+        "WHERE c.id = %s AND c.user_id = %s",
+        (conversation_id, user_id))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    summary, through_id = row
+
+    limit = CONTEXT_RECENT_MESSAGES + CONTEXT_SUMMARY_BATCH
+    cur.execute(
+        "SELECT id, sender, message FROM chat_history WHERE conversation_id = %s AND id > %s "
+        "ORDER BY id DESC LIMIT %s",
+        (conversation_id, through_id, limit))
+    rows = list(reversed(cur.fetchall()))
+
+    fold = []
+    if len(rows) >= limit:
+        rows = rows[-CONTEXT_RECENT_MESSAGES:]
+        # More may be waiting than this query returned; fold from the oldest one.
+        cur.execute(
+            "SELECT id, sender, message FROM chat_history WHERE conversation_id = %s AND id > %s AND id < %s "
+            "ORDER BY id LIMIT %s",
+            (conversation_id, through_id, rows[0][0], CONTEXT_SUMMARY_BATCH * CONTEXT_SUMMARY_MAX_BATCHES))
+        fold = cur.fetchall()
+    return ConversationContext(conversation_id, summary, through_id, rows, fold)
+
+
+def summarize_fold(context, summarize):
+    """Folds context.fold into context.summary, a batch at a time; returns True if the summary changed.
+
+    `summarize(previous_summary, transcript)` returns the new summary text.
+    Only the new messages are sent, never the whole history. Nothing touches
+    the database, so callers can release their connection while the model
+    runs and store the result with save_summary() afterwards. If summarising
+    fails the messages not yet folded are moved back to the recent window and
+    are retried by a later fold.
+    """
+    changed = False
+    while context.fold:
+        batch = context.fold[:CONTEXT_SUMMARY_BATCH]
+        transcript = "\n".join(
+            f"{'User' if sender == 'user' else 'Assistant'}: {message[:SUMMARY_MESSAGE_CHARS]}"
+            for _, sender, message in batch)
+        try:
+            summary = summarize(context.summary, transcript)
+        except Exception as e:
+            print(f"Conversation summary error: {e}")
+            context.recent = context.fold + context.recent
+            context.fold = []
+            break
+        context.summary = summary
+        context.summarized_through_id = batch[-1][0]
+        context.fold = context.fold[CONTEXT_SUMMARY_BATCH:]
+        changed = True
+    return changed
+
+
+def save_summary(cur, context):
+    """Stores the summary produced by summarize_fold(), unless a newer one is already stored; the caller commits."""
+    cur.execute(
+        """INSERT INTO conversation_summaries AS s (conversation_id, summary, summarized_through_id)
+           VALUES (%s, %s, %s)
+           ON CONFLICT (conversation_id) DO UPDATE
+           SET summary = EXCLUDED.summary,
+               summarized_through_id = EXCLUDED.summarized_through_id,
+               updated_at = NOW()
+           WHERE s.summarized_through_id < EXCLUDED.summarized_through_id""",
+        (context.conversation_id, context.summary, context.summarized_through_id))
+
+
+def build_messages(system_prompt, context, new_messages, context_tokens):
+    """Assembles the prompt, dropping the oldest recent messages that do not fit."""
+    budget = context_tokens - CONTEXT_RESPONSE_TOKENS
+    messages = [{"role": "system", "content": system_prompt}]
+    if context.summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{context.summary}"})
+
+    used = sum(estimate_tokens(m["content"]) for m in messages + new_messages)
+    history = []
+    for _, sender, message in reversed(context.recent):
+        cost = estimate_tokens(message)
+        if used + cost > budget:
+            break
+        role = "user" if sender == "user" else "assistant"
+        history.append({"role": role, "content": message})
+        used += cost
+
+    messages.extend(reversed(history))
+    messages.extend(new_messages)
+    return messages
@@ -0,0 +1,333 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+from flask import g, has_app_context
+
+import metrics
+
+# ---------------- POOL CONFIG ----------------
+# Every gunicorn worker gets its own pool, so the worst case number of
+# server connections is WEB_CONCURRENCY * (DB_POOL_MAX + DB_POOL_OVERFLOW).
+# Keep that below Postgres' max_connections.
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_POOL_OVERFLOW = int(os.getenv("DB_POOL_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# ---------------- ROUND TRIP COUNTING ----------------
+# Every execute / commit / rollback is a round trip to Postgres. They are
+# counted per request (g.db_round_trips) and exported by metrics.py, so N+1
+# query patterns show up in /metrics and in the benchmarks.
+def count_round_trip():
+    if has_app_context():
+        g.db_round_trips = g.get("db_round_trips", 0) + 1
+
+
+class _CountingCursorMixin:
+    def execute(self, query, vars=None):
+        count_round_trip()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        count_round_trip()
+        return super().executemany(query, vars_list)
+
+
+_counting_cursor_classes = {}
+
+
+def _counting_cursor_class(base):
+    cls = _counting_cursor_classes.get(base)
+    if cls is None:
+        cls = _counting_cursor_classes[base] = type(f"Counting{base.__name__}", (_CountingCursorMixin, base), {})
+    return cls
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors (of any cursor_factory) count round trips."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _counting_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        count_round_trip()
+        return super().commit()
+
+    def rollback(self):
+        count_round_trip()
+        return super().rollback()
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with overflow, checkout health checks and stats.
+
+    Up to `maxconn` connections are kept open; when they are all checked out,
+    up to `max_overflow` extra connections may be opened and are closed again
+    as soon as they are returned. Beyond that, callers wait up to `timeout`
+    seconds for a connection to be returned.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=5, max_overflow=0, timeout=10.0,
+                 recycle=1800.0, ping_after=30.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()        # (conn, created_at, returned_at)
+        self._in_use = {}           # id(conn) -> created_at
+        self._size = 0              # open connections, idle + in use + being opened
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "overflow_created": 0,
+            "health_check_failures": 0,
+        }
+
+        for _ in range(minconn):
+            with self._cond:
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=CountingConnection)
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["connections_closed"] += 1
+
+    def _healthy(self, conn, created_at, returned_at):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.recycle and now - created_at > self.recycle:
+            return False
+        if self.ping_after is not None and now - returned_at > self.ping_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn + self.max_overflow:
+                    if self._size >= self.maxconn:
+                        self._stats["overflow_created"] += 1
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"timed out after {self.timeout}s waiting for a database connection "
+                        f"({self._size} open, {len(self._in_use)} in use)")
+                waited = True
+                self._cond.wait(remaining)
+
+        # Connecting and pinging happen outside the lock; the slot is already reserved.
+        try:
+            if conn is not None and not self._healthy(conn, created_at, returned_at):
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+                created_at = time.monotonic()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        wait = time.monotonic() - started
+        with self._cond:
+            self._in_use[id(conn)] = created_at
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds_total"] += wait
+                self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+        if created_at is None:
+            return
+
+        if not discard and not conn.closed:
+            # Never hand the next request a connection with an open transaction.
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            overflow = self._size > self.maxconn
+            if discard or overflow or conn.closed or self._closed:
+                self._size -= 1
+                close = True
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+                close = False
+            self._cond.notify()
+        if close:
+            self._close(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            in_use = len(self._in_use)
+            return dict(
+                self._stats,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=in_use,
+                overflow=max(0, self._size - self.maxconn),
+                max_size=self.maxconn,
+                max_overflow=self.max_overflow,
+            )
+
+
+# ---------------- PER-PROCESS POOL ----------------
+# The pool is created lazily and keyed by pid so that connections are never
+# shared across a gunicorn fork.
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if DATABASE_URL is None:
+                raise ValueError("DATABASE_URL environment variable is not set")
+            _pool = ConnectionPool(
+                DATABASE_URL,
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                max_overflow=DB_POOL_OVERFLOW,
+                timeout=DB_POOL_TIMEOUT,
+                recycle=DB_POOL_RECYCLE,
+                ping_after=DB_POOL_PING_AFTER,
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def pool_stats():
+    if _pool is None or _pool_pid != os.getpid():
+        return {}
+    return _pool.stats()
+
+
+class PooledConnection:
+    """Proxy around a checked-out connection; close() returns it to the pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self.released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self._pool.putconn(self._conn)
+
+
+def get_db_connection():
+    """Check out a connection for the current request (or app context).
+
+    Repeated calls inside one request share the same connection until it is
+    closed; whatever is still checked out is returned when the context ends,
+    so early returns and exceptions cannot leak connections.
+    """
+    if not has_app_context():
+        pool = get_pool()
+        return PooledConnection(pool, pool.getconn())
+    conn = g.get("_db_conn")
+    if conn is None or conn.released:
+        pool = get_pool()
+        with metrics.phase("db_connect"):
+            conn = PooledConnection(pool, pool.getconn())
+        g._db_conn = conn
+    return conn
+
+
+def release_db_connection(exc=None):
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
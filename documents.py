@@ -0,0 +1,96 @@
+import hashlib
+import os
+
+from psycopg2.extras import execute_values
+
+from context_builder import estimate_tokens
+
+# ---------------- DOCUMENT RETRIEVAL ----------------
+# Files uploaded in a chat are extracted once, split into overlapping chunks
+# and stored in document_chunks with a generated tsvector (GIN indexed),
+# attached to the conversation. Every later turn pulls only the chunks that
+# best match the question (Postgres full-text ranking) until
+# DOCUMENT_CONTEXT_TOKENS is used up. Prompt size therefore stays the same
+# whether the document has 2 pages or 500. When nothing matches (e.g. "summarise
+# this"), the opening chunks of the latest document are used instead.
+DOCUMENT_INDEX_MAX_CHARS = int(os.getenv("DOCUMENT_INDEX_MAX_CHARS", "2000000"))
+DOCUMENT_CONTEXT_TOKENS = int(os.getenv("DOCUMENT_CONTEXT_TOKENS", "1200"))
+DOCUMENT_TOP_K = int(os.getenv("DOCUMENT_TOP_K", "6"))
+CHUNK_CHARS = 1500
+CHUNK_OVERLAP = 200
+
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Splits text into ~chunk_chars pieces, preferring paragraph, line and sentence breaks."""
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_chars)
+        if end < len(text):
+            window = text[start:end]
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(separator)
+                if cut > chunk_chars // 2:
+                    end = start + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def index_document(cur, conversation_id, filename, text):
+    """Stores the chunks of an uploaded document; re-uploading the same text is a no-op. The caller commits."""
+    document_key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    chunks = chunk_text(text)
+    if not chunks:
+        return 0
+    execute_values(cur,
+        """INSERT INTO document_chunks (conversation_id, document_key, filename, chunk_index, content)
+           VALUES %s ON CONFLICT (conversation_id, document_key, chunk_index) DO NOTHING""",
+        [(conversation_id, document_key, filename, i, chunk) for i, chunk in enumerate(chunks)])
+    return len(chunks)
+
+
+def retrieve(cur, conversation_id, query, token_budget=DOCUMENT_CONTEXT_TOKENS, k=DOCUMENT_TOP_K):
+    """Returns [(filename, chunk_index, content)] for the best-matching chunks within the token budget.
+
+    Query words are OR-ed so a chunk only needs some of them; ts_rank_cd
+    favours chunks that contain more of them close together. One round trip,
+    and it returns nothing for conversations without documents.
+    """
+    cur.execute("""
+        WITH q AS (
+            SELECT NULLIF(replace(plainto_tsquery('english', %(query)s)::text, ' & ', ' | '), '')::tsquery AS query
+        ), matches AS (
+            SELECT c.filename, c.chunk_index, c.content, ts_rank_cd(c.tsv, q.query) AS rank
+            FROM document_chunks c, q
+            WHERE c.conversation_id = %(cid)s AND c.tsv @@ q.query
+            ORDER BY rank DESC, c.id
+            LIMIT %(k)s
+        )
+        SELECT filename, chunk_index, content FROM matches
+        UNION ALL
+        (SELECT filename, chunk_index, content FROM document_chunks
+         WHERE conversation_id = %(cid)s AND NOT EXISTS (SELECT 1 FROM matches)
+         ORDER BY created_at DESC, document_key, chunk_index
+         LIMIT %(k)s)
+    """, {"query": query or "", "cid": conversation_id, "k": k})
+    selected = []
+    used = 0
+    for filename, chunk_index, content in cur.fetchall():
+        cost = estimate_tokens(content)
+        if used + cost > token_budget:
+            continue
+        selected.append((filename, chunk_index, content))
+        used += cost
+    # Present excerpts in document order.
+    return sorted(selected, key=lambda chunk: (chunk[0], chunk[1]))
+
+
+def format_excerpts(chunks):
+    return "\n\n".join(f"[{filename}, part {chunk_index + 1}]\n{content}" for filename, chunk_index, content in chunks)
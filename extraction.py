@@ -0,0 +1,267 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# ---------------- DOCUMENT EXTRACTION ----------------
+# Callers only ever use the first few thousand characters of a document, so
+# extraction walks pages lazily and stops as soon as `max_chars` is reached:
+# a 500 page PDF costs about the same as a 5 page one. OCR (images and PDF
+# pages without a text layer) runs in a per-process pool of worker processes
+# with a deadline per document. PyMuPDF, pytesseract/PIL and python-docx are
+# imported on first use so that processes which never see an upload skip them.
+# The extractors return (text, complete); complete is False when OCR ran out
+# of time, or its worker process died, and the text is partial or empty. Such
+# results are not cached. A pool whose worker died is replaced on next use.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "30"))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+# Pages with less extractable text than this are treated as scanned and OCR'd.
+SCANNED_PAGE_MIN_CHARS = 20
+
+# Bump EXTRACTOR_VERSION whenever extraction output changes so cached text is not reused.
+EXTRACTOR_VERSION = "2"
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+EXTRACTION_CACHE_EVICT_EVERY = int(os.getenv("EXTRACTION_CACHE_EVICT_EVERY",
+                                             str(EXTRACTION_CACHE_MAX_BYTES // 20)))
+
+_ocr_pool = None
+_ocr_pool_pid = None
+
+
+def running_under_gevent():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+class OCRTimeout(Exception):
+    """tesseract was killed after its deadline."""
+
+
+def get_ocr_pool():
+    global _ocr_pool, _ocr_pool_pid
+    # A ProcessPoolExecutor is unusable for good once a worker dies (e.g. OOM-killed).
+    broken = _ocr_pool is not None and getattr(_ocr_pool, "_broken", False)
+    if broken:
+        print("OCR pool is broken (a worker died); starting a new one.")
+        _ocr_pool.shutdown(wait=False, cancel_futures=True)
+    if _ocr_pool is None or broken or _ocr_pool_pid != os.getpid():
+        # Under gevent workers, multiprocessing pools do not mix with monkey-patching.
+        # pytesseract already runs tesseract as a subprocess, which gevent waits on
+        # cooperatively, so greenlet "threads" give the same parallelism there.
+        if running_under_gevent():
+            _ocr_pool = ThreadPoolExecutor(max_workers=OCR_WORKERS)
+        else:
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+        _ocr_pool_pid = os.getpid()
+    return _ocr_pool
+
+
+def ocr_image_bytes(data, timeout=None):
+    # Runs inside an OCR worker process; tesseract itself is killed after `timeout`.
+    import pytesseract
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    # pytesseract's own exceptions cannot be unpickled, and one that crosses
+    # the process boundary breaks the pool, so re-raise them as plain ones.
+    try:
+        return pytesseract.image_to_string(image, timeout=timeout or 0)
+    except (pytesseract.TesseractError, pytesseract.TesseractNotFoundError, RuntimeError) as e:
+        if str(e) == "Tesseract process timeout":
+            raise OCRTimeout(str(e)) from None
+        raise RuntimeError(f"OCR failed: {e}") from None
+
+
+def _submit_ocr(data, deadline):
+    remaining = max(1.0, deadline - time.monotonic())
+    return get_ocr_pool().submit(ocr_image_bytes, data, remaining)
+
+
+def _result(future, deadline):
+    return future.result(timeout=max(0.0, deadline - time.monotonic()))
+
+
+def extract_text_from_pdf(data, max_chars=None, timeout=OCR_TIMEOUT):
+    import fitz  # PyMuPDF
+    deadline = time.monotonic() + timeout
+    complete = True
+    chunks = []
+    total = 0
+    # Page results in page order: str for text pages, Future for pages being OCR'd.
+    # At most OCR_WORKERS * 2 OCR pages are in flight so we never OCR far past the budget.
+    queue = deque()
+    in_flight = 0
+
+    def settle(block):
+        nonlocal total, in_flight
+        while queue and (max_chars is None or total < max_chars):
+            item = queue[0]
+            if not isinstance(item, str):
+                if not (block or item.done() or in_flight > OCR_WORKERS * 2):
+                    return
+                item = _result(item, deadline)
+                in_flight -= 1
+            queue.popleft()
+            chunks.append(item)
+            total += len(item)
+
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            for page in doc:
+                if max_chars is not None and total >= max_chars:
+                    break
+                text = page.get_text()
+                if len(text.strip()) < SCANNED_PAGE_MIN_CHARS:
+                    png = page.get_pixmap(dpi=OCR_DPI).tobytes("png")
+                    queue.append(_submit_ocr(png, deadline))
+                    in_flight += 1
+                else:
+                    queue.append(text)
+                settle(block=False)
+        settle(block=True)
+    except (FutureTimeout, OCRTimeout):
+        complete = False
+        print(f"PDF OCR timed out after {timeout}s; using the text extracted so far.")
+    except BrokenExecutor:
+        complete = False
+        print("PDF OCR worker died; using the text extracted so far.")
+    finally:
+        for item in queue:
+            if not isinstance(item, str):
+                item.cancel()
+
+    text = "".join(chunks)
+    return (text[:max_chars] if max_chars is not None else text), complete
+
+
+def extract_text_from_image(data, timeout=OCR_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    future = _submit_ocr(data, deadline)
+    try:
+        return _result(future, deadline), True
+    except (FutureTimeout, OCRTimeout):
+        future.cancel()
+        print(f"Image OCR timed out after {timeout}s.")
+        return "", False
+    except BrokenExecutor:
+        print("Image OCR worker died.")
+        return "", False
+
+
+def extract_text_from_docx(data, max_chars=None):
+    import docx
+    doc = docx.Document(io.BytesIO(data))
+    paragraphs = []
+    total = 0
+    for para in doc.paragraphs:
+        if max_chars is not None and total >= max_chars:
+            break
+        paragraphs.append(para.text)
+        total += len(para.text) + 1
+    text = "\n".join(paragraphs)
+    return (text[:max_chars] if max_chars is not None else text), True
+
+
+def extract_text(filename, data, max_chars=None):
+    """Extracts up to `max_chars` of text from an uploaded PDF, image or DOCX; returns (text, complete)."""
+    filename = filename.lower()
+    if filename.endswith('.pdf'):
+        return extract_text_from_pdf(data, max_chars)
+    if filename.endswith(('.png', '.jpg', '.jpeg')):
+        text, complete = extract_text_from_image(data)
+        return (text[:max_chars] if max_chars is not None else text), complete
+    if filename.endswith('.docx'):
+        return extract_text_from_docx(data, max_chars)
+    return "", True
+
+
+# ---------------- EXTRACTION CACHE ----------------
+# Extracted text is stored in the extraction_cache table keyed by the SHA-256
+# of the uploaded bytes, the extractor version and the character budget, so a
+# repeated upload skips PyMuPDF / python-docx / tesseract entirely. The table
+# is kept around EXTRACTION_CACHE_MAX_BYTES by evicting least recently used
+# rows. Eviction has to scan the whole table, so a process only runs it after
+# it has stored another EXTRACTION_CACHE_EVICT_EVERY bytes; the cache can go
+# over its cap by about that much per process. Incomplete extractions are not
+# stored.
+_cache_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_cache_stats_lock = threading.Lock()
+_bytes_since_eviction = 0
+
+
+def _count(name, n=1):
+    with _cache_stats_lock:
+        _cache_stats[name] += n
+
+
+def cache_stats():
+    with _cache_stats_lock:
+        return dict(_cache_stats)
+
+
+def extraction_cache_key(filename, data, max_chars=None):
+    digest = hashlib.sha256(data).hexdigest()
+    kind = os.path.splitext(filename.lower())[1]
+    return hashlib.sha256(f"{EXTRACTOR_VERSION}:{kind}:{max_chars}:{digest}".encode("utf-8")).hexdigest()
+
+
+def lookup_cached_text(cur, key):
+    """Returns the cached text for an extraction_cache_key(), or None; the caller commits."""
+    cur.execute("""UPDATE extraction_cache SET last_used_at = NOW(), hits = hits + 1
+                   WHERE cache_key = %s RETURNING text""", (key,))
+    row = cur.fetchone()
+    if row is not None:
+        _count("hits")
+        return row[0]
+    _count("misses")
+    return None
+
+
+def extract_text_cached(cur, filename, data, max_chars=None):
+    """extract_text() behind the extraction cache; returns the text. The caller commits.
+
+    The connection stays checked out while extracting. Request handlers that
+    should not hold it during OCR use lookup_cached_text(), extract_text() and
+    store_cached_text() separately.
+    """
+    key = extraction_cache_key(filename, data, max_chars)
+    text = lookup_cached_text(cur, key)
+    if text is not None:
+        return text
+    text, complete = extract_text(filename, data, max_chars)
+    if complete:
+        store_cached_text(cur, key, text)
+    return text
+
+
+def store_cached_text(cur, key, text):
+    """Stores a complete extraction and now and then evicts old entries; the caller commits."""
+    global _bytes_since_eviction
+    size = len(text.encode("utf-8"))
+    if size > EXTRACTION_CACHE_MAX_BYTES:
+        return
+
+    cur.execute("""INSERT INTO extraction_cache (cache_key, text, size_bytes) VALUES (%s, %s, %s)
+                   ON CONFLICT (cache_key) DO NOTHING""", (key, text, size))
+    if not cur.rowcount:
+        return
+    _count("stores")
+    with _cache_stats_lock:
+        _bytes_since_eviction += size
+        if _bytes_since_eviction < EXTRACTION_CACHE_EVICT_EVERY:
+            return
+        _bytes_since_eviction = 0
+    cur.execute("""DELETE FROM extraction_cache WHERE cache_key IN (
+                       SELECT cache_key FROM (
+                           SELECT cache_key, SUM(size_bytes) OVER (ORDER BY last_used_at DESC, cache_key) AS running
+                           FROM extraction_cache
+                       ) ranked WHERE running > %s
+                   )""", (EXTRACTION_CACHE_MAX_BYTES,))
+    if cur.rowcount:
+        _count("evictions", cur.rowcount)
@@ -0,0 +1,42 @@
+import os
+
+# gunicorn -c gunicorn.conf.py app:app
+#
+# GUNICORN_WORKER_CLASS=sync    one request per worker process (default)
+# GUNICORN_WORKER_CLASS=gevent  cooperative mode: every worker serves up to
+#                               GUNICORN_WORKER_CONNECTIONS requests at once, so
+#                               requests waiting on Groq or Postgres no longer
+#                               tie up a whole process.
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "200"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# GUNICORN_PRELOAD=1 imports the app, and the libraries it otherwise loads on
+# first use, once in the master. Workers are then forked with everything
+# already imported, so they boot faster and share those pages. Code changes
+# then need a full restart rather than a HUP. Under gevent the master is
+# monkey-patched before the app is imported. Otherwise the locks created at
+# import time would be real thread locks that can block every greenlet in a
+# worker.
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+if preload_app and worker_class == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+        app.import_heavy_modules()
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # Make psycopg2 yield to other greenlets while it waits on the server.
+        # The Groq client is httpx-based and becomes cooperative through
+        # gevent's socket monkey-patching.
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,199 @@
+import json
+import os
+import random
+import time
+import traceback
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from flask import g
+
+from db import get_db_connection
+
+# ---------------- JOB QUEUE CONFIG ----------------
+# Slow work (syllabus parsing, note generation) is queued in the `jobs` table
+# and executed by `python worker.py`, so web workers answer immediately.
+# Set JOBS_INLINE=1 to run jobs inside the request instead (no worker needed,
+# handy for local development with `flask run`).
+JOBS_INLINE = os.getenv("JOBS_INLINE", "0") == "1"
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Registers `func(job)` as the handler for jobs of this kind.
+
+    The handler receives the claimed job row (id, kind, user_id, payload,
+    input_blob, attempts) and returns a JSON-serialisable result. Raising
+    marks the attempt as failed and schedules a retry with backoff.
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(cur, kind, payload, user_id=None, blob=None, dedupe_key=None, max_attempts=None):
+    """Queues a job and returns its id.
+
+    With a dedupe_key, an identical job that is still queued or running is
+    reused instead of creating a second one.
+    """
+    params = (kind, dedupe_key, user_id, json.dumps(payload),
+              psycopg2.Binary(blob) if blob is not None else None,
+              max_attempts or JOB_MAX_ATTEMPTS)
+    if dedupe_key is None:
+        cur.execute("""INSERT INTO jobs (kind, dedupe_key, user_id, payload, input_blob, max_attempts)
+                       VALUES (%s, %s, %s, %s, %s, %s) RETURNING id""", params)
+        return cur.fetchone()[0]
+
+    cur.execute("""INSERT INTO jobs (kind, dedupe_key, user_id, payload, input_blob, max_attempts)
+                   VALUES (%s, %s, %s, %s, %s, %s)
+                   ON CONFLICT (kind, dedupe_key) WHERE status IN ('queued', 'running') AND dedupe_key IS NOT NULL
+                   DO NOTHING RETURNING id""", params)
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    cur.execute("SELECT id FROM jobs WHERE kind = %s AND dedupe_key = %s AND status IN ('queued', 'running')",
+        (kind, dedupe_key))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    # The active job finished between the two statements; queue a fresh one.
+    return enqueue(cur, kind, payload, user_id=user_id, blob=blob, max_attempts=max_attempts)
+
+
+def get_job(cur, job_id, user_id, shared=False):
+    """Returns a job the user owns, or None.
+
+    enqueue() can hand a user a deduplicated job another user created; the
+    caller passes shared=True for job ids it gave this user, and the status of
+    such a job is returned without its result and error.
+    """
+    cur.execute("""SELECT id, kind, status, attempts, max_attempts,
+                          CASE WHEN user_id = %(user_id)s THEN result END AS result,
+                          CASE WHEN user_id = %(user_id)s THEN error END AS error,
+                          created_at, updated_at
+                   FROM jobs WHERE id = %(job_id)s AND (user_id = %(user_id)s OR %(shared)s)""",
+                {"job_id": job_id, "user_id": user_id, "shared": shared})
+    row = cur.fetchone()
+    if row is None:
+        return None
+    keys = ("id", "kind", "status", "attempts", "max_attempts", "result", "error", "created_at", "updated_at")
+    return dict(zip(keys, row)) if not isinstance(row, dict) else dict(row)
+
+
+def backoff_seconds(attempt):
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.5)
+
+
+_CLAIM_COLUMNS = "id, kind, user_id, payload, input_blob, attempts, max_attempts"
+
+
+def claim_next(cur, job_id=None):
+    """Claims one runnable job (optionally a specific one) with SKIP LOCKED.
+
+    Jobs whose worker died mid-run are picked up again once their lease
+    expires, unless that was their last attempt: a job that keeps killing its
+    worker (e.g. out of memory) is marked failed instead of retried forever.
+    """
+    where = ("((status = 'queued' AND run_after <= NOW())"
+             " OR (status = 'running' AND locked_until < NOW() AND attempts < max_attempts))")
+    params = [JOB_LEASE_SECONDS]
+    if job_id is not None:
+        where += " AND id = %s"
+        params.append(job_id)
+    cur.execute(f"""WITH abandoned AS (
+                        UPDATE jobs SET status = 'failed', input_blob = NULL, locked_until = NULL, updated_at = NOW(),
+                                        error = 'The worker stopped during the last attempt'
+                        WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts
+                    )
+                    UPDATE jobs
+                    SET status = 'running', attempts = attempts + 1,
+                        locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+                    WHERE id = (SELECT id FROM jobs WHERE {where}
+                                ORDER BY run_after, id LIMIT 1 FOR UPDATE SKIP LOCKED)
+                    RETURNING {_CLAIM_COLUMNS}""", params)
+    return cur.fetchone()
+
+
+def mark_succeeded(cur, job_id, result):
+    cur.execute("""UPDATE jobs SET status = 'succeeded', result = %s, error = NULL, input_blob = NULL,
+                       locked_until = NULL, updated_at = NOW()
+                   WHERE id = %s""", (json.dumps(result), job_id))
+
+
+def mark_failed(cur, job, error, retry=True):
+    if retry and job["attempts"] < job["max_attempts"]:
+        cur.execute("""UPDATE jobs SET status = 'queued', error = %s, locked_until = NULL,
+                           run_after = NOW() + make_interval(secs => %s), updated_at = NOW()
+                       WHERE id = %s""", (error, backoff_seconds(job["attempts"]), job["id"]))
+    else:
+        cur.execute("""UPDATE jobs SET status = 'failed', error = %s, input_blob = NULL,
+                           locked_until = NULL, updated_at = NOW()
+                       WHERE id = %s""", (error, job["id"]))
+
+
+def run_one(app, job_id=None, retry=True):
+    """Claims and runs a single job. Returns False when nothing was runnable."""
+    with app.app_context():
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        job = claim_next(cur, job_id)
+        conn.commit()
+        cur.close()
+        conn.close()
+        if job is None:
+            return False
+
+        job = dict(job)
+        g.metrics_route = f"job:{job['kind']}"
+        if job["input_blob"] is not None:
+            job["input_blob"] = bytes(job["input_blob"])
+
+        try:
+            handler = HANDLERS[job["kind"]]
+            result = handler(job)
+        except Exception as e:
+            print(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed:", traceback.format_exc())
+            conn = get_db_connection()
+            conn.rollback()
+            cur = conn.cursor()
+            mark_failed(cur, job, str(e), retry=retry)
+        else:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            mark_succeeded(cur, job["id"], result)
+        conn.commit()
+        cur.close()
+        conn.close()
+        return True
+
+
+def dispatch(app, job_id):
+    """Called by routes after committing an enqueue; runs the job now when JOBS_INLINE is set.
+
+    Inline jobs are not retried: there is no worker to pick up a delayed retry.
+    """
+    if JOBS_INLINE:
+        run_one(app, job_id, retry=False)
+
+
+def work(app, poll_interval=None):
+    poll_interval = poll_interval or JOB_POLL_INTERVAL
+    print(f"👷 Job worker started (pid {os.getpid()}), handlers: {', '.join(sorted(HANDLERS))}")
+    while True:
+        try:
+            ran = run_one(app)
+        except Exception:
+            print("🔥 Job worker error:", traceback.format_exc())
+            ran = False
+        if not ran:
+            time.sleep(poll_interval)
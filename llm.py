@@ -0,0 +1,354 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+# ---------------- LLM GATEWAY ----------------
+# Every Groq call goes through complete() / stream() so that all of them get:
+#   * a deadline for the whole call, retries included (LLM_TIMEOUT),
+#   * retries with jittered exponential backoff on timeouts, connection
+#     errors, 429 and 5xx, honouring Retry-After,
+#   * a client-side token bucket so we stay under the account quota instead of
+#     collecting 429s (LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE; the
+#     buckets are per process, so divide the quota by the number of processes),
+#   * a circuit breaker per model that fails fast while a model keeps erroring,
+#   * fallback from GROQ_MODEL_LARGE to GROQ_MODEL_FAST.
+# The SDK's own retries are disabled so the policy lives in one place. Point
+# GROQ_BASE_URL at benchmarks/fake_groq.py to exercise it locally. The SDK is
+# imported on first use, so processes that never call the LLM never load it.
+GROQ_MODEL_FAST = os.getenv("GROQ_MODEL_FAST", "gemma-7b-it")
+GROQ_MODEL_LARGE = os.getenv("GROQ_MODEL_LARGE", "gemma2-9b-it")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Model to try when a model's retries are exhausted or its breaker is open.
+FALLBACK_MODELS = {GROQ_MODEL_LARGE: GROQ_MODEL_FAST} if GROQ_MODEL_LARGE != GROQ_MODEL_FAST else {}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMUnavailable(LLMError):
+    """No model could answer before the deadline (breaker open, throttled or failing upstream)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+LLM_RETRIES = metrics.Counter("llm_retries_total",
+    "LLM attempts that failed and were retried.", ("model", "reason"))
+LLM_FALLBACKS = metrics.Counter("llm_fallbacks_total",
+    "Calls answered by a fallback model.", ("model", "fallback"))
+LLM_REJECTED = metrics.Counter("llm_rejected_total",
+    "Calls refused without reaching the API.", ("model", "reason"))
+
+
+class TokenBucket:
+    """Refills `rate` units per second up to `capacity`; acquire() blocks until units are free."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1, deadline=None):
+        """Takes `amount` units, waiting as needed. Returns False if that would pass the deadline."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self._blocked_until - now, (amount - self._tokens) / self.rate, 0.0)
+                if wait <= 0:
+                    self._tokens -= amount
+                    return True
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    def block_for(self, seconds):
+        """Stops handing out units for `seconds` (the API told us to back off)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` one trial call is let through."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+# ---------------- PER-PROCESS STATE ----------------
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_breakers = {}
+_request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE / 60.0, max(1.0, LLM_REQUESTS_PER_MINUTE / 6)) \
+    if LLM_REQUESTS_PER_MINUTE > 0 else None
+_token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE / 60.0, LLM_TOKENS_PER_MINUTE / 6) \
+    if LLM_TOKENS_PER_MINUTE > 0 else None
+
+
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                import groq
+                _client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+                _client_pid = os.getpid()
+    return _client
+
+
+def get_breaker(model):
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers.setdefault(model, CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN))
+    return breaker
+
+
+def breaker_states():
+    return {model: breaker.state for model, breaker in _breakers.items()}
+
+
+def estimate_request_tokens(messages, max_tokens=None):
+    prompt = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    return prompt + (max_tokens or 512)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _classify(error):
+    """Returns a retry reason for transient errors, None for errors a retry cannot fix."""
+    import groq
+    if isinstance(error, groq.APITimeoutError):
+        return "timeout"
+    if isinstance(error, groq.APIConnectionError):
+        return "connection"
+    if isinstance(error, groq.APIStatusError) and error.status_code in RETRYABLE_STATUS:
+        return str(error.status_code)
+    return None
+
+
+def _backoff(attempt):
+    delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, delay)  # "full jitter"
+
+
+def _throttle(model, messages, kwargs, deadline):
+    if _request_bucket is not None and not _request_bucket.acquire(1, deadline):
+        LLM_REJECTED.inc(model=model, reason="rate_limit")
+        raise LLMUnavailable("LLM request quota exhausted", retry_after=1 / _request_bucket.rate)
+    if _token_bucket is not None:
+        needed = estimate_request_tokens(messages, kwargs.get("max_tokens"))
+        if not _token_bucket.acquire(needed, deadline):
+            LLM_REJECTED.inc(model=model, reason="token_limit")
+            raise LLMUnavailable("LLM token quota exhausted", retry_after=needed / _token_bucket.rate)
+
+
+def _call_with_retries(model, messages, deadline, kwargs):
+    """Runs one model's attempts until success, a permanent error or the deadline.
+
+    Returns the SDK response (or stream). Transient failures after the last
+    attempt are raised as LLMUnavailable so the caller can fall back.
+    """
+    breaker = get_breaker(model)
+    last_error = None
+    retry_after = None
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        _throttle(model, messages, kwargs, deadline)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not breaker.allow():
+            LLM_REJECTED.inc(model=model, reason="circuit_open")
+            raise LLMUnavailable(f"{model} is failing; circuit open", retry_after=breaker.retry_after())
+        import httpx
+        timeout = httpx.Timeout(remaining, connect=min(LLM_CONNECT_TIMEOUT, remaining))
+        try:
+            response = get_client().chat.completions.create(
+                messages=messages, model=model, timeout=timeout, **kwargs)
+        except Exception as e:
+            reason = _classify(e)
+            if reason is None:
+                breaker.record_success()  # the model answered; the request itself was bad
+                raise
+            breaker.record_failure()
+            last_error = e
+            retry_after = _retry_after(e)
+            if retry_after is not None and _request_bucket is not None:
+                _request_bucket.block_for(retry_after)
+            delay = retry_after if retry_after is not None else _backoff(attempt)
+            if attempt == LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                break
+            LLM_RETRIES.inc(model=model, reason=reason)
+            print(f"LLM {model} attempt {attempt + 1} failed ({reason}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return response
+    raise LLMUnavailable(f"{model} did not answer: {last_error or 'deadline exceeded'}", retry_after=retry_after)
+
+
+def _models(model, fallback):
+    chain = [model]
+    while fallback and chain[-1] in FALLBACK_MODELS and FALLBACK_MODELS[chain[-1]] not in chain:
+        chain.append(FALLBACK_MODELS[chain[-1]])
+    return chain
+
+
+def complete(model, messages, timeout=None, fallback=True, **kwargs):
+    """Non-streaming chat completion through the gateway.
+
+    `timeout` bounds the whole call, retries and fallbacks included. Raises
+    LLMUnavailable when no model answered in time, and the SDK error for
+    requests that can never succeed (bad request, auth).
+    """
+    deadline = time.monotonic() + (timeout or LLM_TIMEOUT)
+    started = time.perf_counter()
+    error = None
+    for used in _models(model, fallback):
+        try:
+            with metrics.phase("llm_call"):
+                completion = _call_with_retries(used, messages, deadline, kwargs)
+        except LLMUnavailable as e:
+            error = e
+            continue
+        if used != model:
+            LLM_FALLBACKS.inc(model=model, fallback=used)
+        metrics.record_llm_call(used, started, usage=getattr(completion, "usage", None))
+        return completion
+    raise error
+
+
+def stream(model, messages, timeout=None, fallback=True, **kwargs):
+    """Streams a chat completion, yielding text deltas.
+
+    Retries and fallback only happen before the first chunk; once text has
+    been yielded an error is raised to the caller. The deadline is checked
+    between chunks as well.
+    """
+    deadline = time.monotonic() + (timeout or LLM_TIMEOUT)
+    started = time.perf_counter()
+    error = None
+    for used in _models(model, fallback):
+        try:
+            response = _call_with_retries(used, messages, deadline, dict(kwargs, stream=True))
+        except LLMUnavailable as e:
+            error = e
+            continue
+        if used != model:
+            LLM_FALLBACKS.inc(model=model, fallback=used)
+        break
+    else:
+        raise error
+
+    first_token_at = None
+    usage = None
+    with response:
+        for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            # Groq reports token usage on the final chunk under x_groq.
+            x_groq = getattr(chunk, "x_groq", None)
+            if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                usage = x_groq.usage
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield delta
+            if time.monotonic() > deadline:
+                raise LLMError(f"{used} stream exceeded its {timeout or LLM_TIMEOUT:.0f}s deadline")
+    metrics.record_llm_call(used, started, first_token_at, usage)
+
+
+@metrics.register_collector
+def collect_breaker_metrics():
+    states = ("closed", "half_open", "open")
+    return [("llm_circuit_state", "gauge", "Circuit breaker state per model (1 for the current state).",
+             [({"model": model, "state": s}, int(state == s))
+              for model, state in breaker_states().items() for s in states])]
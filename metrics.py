@@ -0,0 +1,259 @@
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, has_request_context, request
+
+# ---------------- METRICS ----------------
+# Minimal in-process Prometheus instrumentation, served as text at /metrics.
+# Each gunicorn worker keeps its own numbers, so a scrape reflects the worker
+# that answered it; run a single worker per target when exact totals matter.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+_collectors = []
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with _lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with _lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        lines = self.header()
+        for key, bucket_counts, total, count in items:
+            for bound, n in zip(self.buckets, bucket_counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(float(bound))),))} {n}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def register_collector(func):
+    """Registers `func()` -> [(name, type, help, [(labels_dict, value)])] evaluated at scrape time."""
+    _collectors.append(func)
+    return func
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            print(f"Metrics collector error: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- APP METRICS ----------------
+REQUEST_SECONDS = Histogram("app_request_duration_seconds",
+    "Time to produce a response (streamed bodies continue after this).", ("route", "method", "status"))
+PHASE_SECONDS = Histogram("app_request_phase_seconds",
+    "Time spent in each phase of a request.", ("route", "phase"))
+LLM_SECONDS = Histogram("llm_request_duration_seconds",
+    "Duration of LLM completions, including streaming.", ("route", "model"))
+LLM_TTFT_SECONDS = Histogram("llm_time_to_first_token_seconds",
+    "Time until the first token of an LLM completion arrived.", ("route", "model"))
+LLM_TOKENS = Counter("llm_tokens_total",
+    "Tokens reported by the LLM API.", ("route", "model", "kind"))
+DB_ROUND_TRIPS = Histogram("app_request_db_round_trips",
+    "Database round trips (statements, commits, rollbacks) per request, streamed bodies included.",
+    ("route",), buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100))
+
+
+def current_route():
+    if has_request_context() and request.endpoint:
+        # Label by view name without the blueprint prefix ("main.chat" -> "chat").
+        return request.endpoint.rsplit(".", 1)[-1]
+    if has_app_context():
+        return g.get("metrics_route", "background")
+    return "background"
+
+
+@contextmanager
+def phase(name):
+    """Times a block as one phase of the current request (or background job)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        PHASE_SECONDS.observe(elapsed, route=current_route(), phase=name)
+        if has_app_context():
+            timings = g.setdefault("phase_timings", {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def record_llm_call(model, started, first_token_at=None, usage=None):
+    route = current_route()
+    now = time.perf_counter()
+    LLM_SECONDS.observe(now - started, route=route, model=model)
+    LLM_TTFT_SECONDS.observe((first_token_at or now) - started, route=route, model=model)
+    if usage is not None:
+        LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, route=route, model=model, kind="prompt")
+        LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, route=route, model=model, kind="completion")
+
+
+# ---------------- PROFILER HOOK ----------------
+# With PROFILING_ENABLED=1, a request sent with the header
+# `X-Profile: <PROFILING_TOKEN>` is profiled and the report written to
+# PROFILE_DIR; the response names the file in X-Profile-Output. Without a
+# token profiling stays off. Only one request per process is profiled at a
+# time (profilers cannot nest); others sent meanwhile run unprofiled.
+# pyinstrument (a sampling profiler) is used when installed, otherwise cProfile.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1" and bool(PROFILING_TOKEN)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_profile_lock = threading.Lock()
+
+
+def _profile_requested():
+    header = request.headers.get("X-Profile")
+    return header is not None and hmac.compare_digest(header.encode("utf-8"), PROFILING_TOKEN.encode("utf-8"))
+
+
+def _start_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return "cprofile", profiler
+    profiler = Profiler(interval=0.001)
+    profiler.start()
+    return "pyinstrument", profiler
+
+
+def _stop_profiler(kind, profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{current_route()}")
+    if kind == "pyinstrument":
+        profiler.stop()
+        path = stem + ".html"
+        with open(path, "w") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = stem + ".prof"
+        profiler.dump_stats(path)
+    return os.path.basename(path)
+
+
+def _finish_profile():
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return None
+    try:
+        return _stop_profiler(*profiler)
+    finally:
+        _profile_lock.release()
+
+
+def init_app(app):
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        if PROFILING_ENABLED and _profile_requested() and _profile_lock.acquire(blocking=False):
+            try:
+                g.profiler = _start_profiler()
+            except Exception:
+                _profile_lock.release()
+                raise
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started,
+                route=current_route(), method=request.method, status=response.status_code)
+        timings = g.get("phase_timings")
+        if timings:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+        output = _finish_profile()
+        if output is not None:
+            response.headers["X-Profile-Output"] = output
+        return response
+
+    @app.teardown_request
+    def release_profiler(exc=None):
+        # A request that failed before after_request still gives the profiler back.
+        _finish_profile()
+
+    @app.teardown_request
+    def record_db_round_trips(exc=None):
+        # Runs after a streamed body has finished, so writes made by the stream are included.
+        if request.endpoint:
+            DB_ROUND_TRIPS.observe(g.pop("db_round_trips", 0), route=current_route())
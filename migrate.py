@@ -0,0 +1,63 @@
+import os
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Applies the numbered .sql files in migrations/ that have not been applied yet.
+# Each file runs in its own transaction and is recorded in schema_migrations.
+#
+#   python migrate.py           apply pending migrations
+#   python migrate.py --status  list applied / pending migrations
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def migration_files():
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+
+
+def applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(database_url, status_only=False):
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cur:
+            applied = applied_versions(cur)
+        conn.commit()
+
+        for filename in migration_files():
+            version = filename[:-len(".sql")]
+            if version in applied:
+                print(f"  applied  {version}")
+                continue
+            if status_only:
+                print(f"  pending  {version}")
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, filename)) as f:
+                sql = f.read()
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            conn.commit()
+            print(f"  applied  {version} (new)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL is not set.")
+        sys.exit(1)
+    migrate(database_url, status_only="--status" in sys.argv)
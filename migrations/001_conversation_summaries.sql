@@ -0,0 +1,8 @@
+-- Rolling summary of the older part of each conversation, used by
+-- context_builder.py so that /chat only has to load the most recent turns.
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    conversation_id INTEGER PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_through_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,11 @@
+-- Generated study notes, content-addressed by
+-- sha256(subject name, sorted topics, prompt version, model).
+CREATE TABLE IF NOT EXISTS notes_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    notes_markdown TEXT NOT NULL,
+    notes_html TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
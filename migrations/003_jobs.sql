@@ -0,0 +1,24 @@
+-- Postgres-backed job queue used by jobs.py / worker.py.
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    payload JSONB NOT NULL DEFAULT '{}',
+    input_blob BYTEA,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued | running | succeeded | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMP,
+    result JSONB,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS jobs_runnable_idx ON jobs (run_after, id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_user_status_idx ON jobs (user_id, kind, status);
+-- At most one active job per (kind, dedupe_key); enqueue() reuses it.
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedupe_idx ON jobs (kind, dedupe_key)
+    WHERE status IN ('queued', 'running') AND dedupe_key IS NOT NULL;
@@ -0,0 +1,12 @@
+-- Text extracted from uploaded files, keyed by
+-- sha256(extractor version, file type, char budget, sha256(file bytes)).
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    text TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS extraction_cache_last_used_idx ON extraction_cache (last_used_at DESC);
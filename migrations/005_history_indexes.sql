@@ -0,0 +1,4 @@
+-- Keyset pagination indexes for /get_conversations and /get_chat.
+-- id is included so the sort order is total even when created_at ties.
+CREATE INDEX IF NOT EXISTS conversations_user_created_idx ON conversations (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS chat_history_conversation_id_idx ON chat_history (conversation_id, id);
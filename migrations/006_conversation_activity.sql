@@ -0,0 +1,21 @@
+-- Per-conversation activity, maintained by the /chat write path, so the
+-- sidebar can sort by recency without scanning chat_history.
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE conversations c SET
+    updated_at = COALESCE(h.last_at, c.created_at, NOW()),
+    message_count = COALESCE(h.n, 0)
+FROM conversations c2
+LEFT JOIN (
+    SELECT conversation_id, MAX(created_at) AS last_at, COUNT(*) AS n
+    FROM chat_history GROUP BY conversation_id
+) h ON h.conversation_id = c2.id
+WHERE c.id = c2.id;
+
+ALTER TABLE conversations ALTER COLUMN updated_at SET DEFAULT NOW();
+ALTER TABLE conversations ALTER COLUMN updated_at SET NOT NULL;
+
+-- The sidebar now pages by (updated_at, id); replaces the created_at index from 005.
+CREATE INDEX IF NOT EXISTS conversations_user_updated_idx ON conversations (user_id, updated_at DESC, id DESC);
+DROP INDEX IF EXISTS conversations_user_created_idx;
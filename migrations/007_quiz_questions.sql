@@ -0,0 +1,14 @@
+-- Pre-generated multiple-choice questions, one bank per set of cached notes.
+-- Deleting (regenerating) the notes drops their questions with them.
+CREATE TABLE IF NOT EXISTS quiz_questions (
+    id SERIAL PRIMARY KEY,
+    notes_cache_key CHAR(64) NOT NULL REFERENCES notes_cache(cache_key) ON DELETE CASCADE,
+    question TEXT NOT NULL,
+    options JSONB NOT NULL,
+    answer TEXT NOT NULL,
+    served_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS quiz_questions_unique_idx ON quiz_questions (notes_cache_key, md5(question));
+CREATE INDEX IF NOT EXISTS quiz_questions_serve_idx ON quiz_questions (notes_cache_key, served_count);
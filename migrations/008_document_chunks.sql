@@ -0,0 +1,14 @@
+-- Chunks of documents uploaded in a chat, retrieved by full-text search on later turns.
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id SERIAL PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    document_key CHAR(64) NOT NULL,
+    filename TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    UNIQUE (conversation_id, document_key, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS document_chunks_tsv_idx ON document_chunks USING GIN (tsv);
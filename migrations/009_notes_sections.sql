@@ -0,0 +1,17 @@
+-- Generated notes split into per-topic sections, each rendered to HTML on its own.
+-- content_hash addresses the rendered HTML so identical sections are rendered once.
+CREATE TABLE IF NOT EXISTS notes_sections (
+    cache_key CHAR(64) NOT NULL REFERENCES notes_cache(cache_key) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    markdown TEXT NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    render_version TEXT NOT NULL,
+    html TEXT NOT NULL,
+    PRIMARY KEY (cache_key, position)
+);
+
+CREATE INDEX IF NOT EXISTS notes_sections_content_hash_idx ON notes_sections (content_hash);
+
+-- The whole-document HTML is no longer written; existing rows are split into sections on first view.
+ALTER TABLE notes_cache ALTER COLUMN notes_html DROP NOT NULL;
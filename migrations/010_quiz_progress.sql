@@ -0,0 +1,35 @@
+-- Every submitted quiz, so progress has a history instead of a single running number.
+CREATE TABLE IF NOT EXISTS quiz_attempts (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    subject_id INTEGER NOT NULL REFERENCES subjects(id),
+    score INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    percentage REAL NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS quiz_attempts_subject_idx ON quiz_attempts (subject_id, created_at);
+
+-- Per-subject aggregate of quiz_attempts, updated in the same statement that
+-- records an attempt, so the dashboard reads it instead of recomputing it.
+CREATE TABLE IF NOT EXISTS subject_progress (
+    subject_id INTEGER PRIMARY KEY REFERENCES subjects(id),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    attempts INTEGER NOT NULL,
+    average REAL NOT NULL,
+    moving_average REAL NOT NULL,
+    trend REAL NOT NULL DEFAULT 0,
+    best_percentage REAL,
+    last_percentage REAL,
+    last_attempt_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS subjects_user_name_idx ON subjects (user_id, name);
+
+-- Carry over the running average kept in subjects.progress. The attempts
+-- behind it were never recorded, so they count as zero.
+INSERT INTO subject_progress (subject_id, user_id, attempts, average, moving_average)
+SELECT id, user_id, 0, progress, progress FROM subjects
+WHERE progress > 0 AND user_id IS NOT NULL
+ON CONFLICT (subject_id) DO NOTHING;
@@ -0,0 +1,10 @@
+-- Per-user request slots shared by every web process (see concurrency.py).
+-- A row is a running request or a place in the user's queue; rows whose
+-- lease has expired belong to requests that died and are reclaimed.
+CREATE TABLE IF NOT EXISTS user_request_slots (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    slot INTEGER NOT NULL,
+    token TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, slot)
+);
@@ -0,0 +1,214 @@
+import hashlib
+import html
+import os
+import re
+import threading
+
+from psycopg2.extras import execute_values
+
+import cache
+
+# ---------------- SECTIONED NOTES ----------------
+# Generated notes are split into per-topic sections at the shallowest heading
+# level that occurs more than once. Each section is rendered to HTML on its
+# own and stored in notes_sections next to the notes. A section's content
+# hash (its markdown plus NOTES_RENDER_VERSION) is the cache key for its HTML.
+# Identical sections, whether in this process or already stored for other
+# notes, are never rendered twice. Bumping NOTES_RENDER_VERSION re-renders
+# stored sections lazily the next time they are read. /view_notes sends the
+# first NOTES_INITIAL_SECTIONS with the page; the rest are fetched as the
+# reader scrolls.
+#
+# Mermaid blocks are emitted as <pre class="mermaid" data-diagram="<hash>">
+# so the browser can render each diagram once, when its section becomes
+# visible, and reuse the SVG from localStorage after that.
+#
+# Section batches are fetched with the notes version (a hash of the stored
+# markdown and NOTES_RENDER_VERSION) in the URL so the browser may cache
+# them; regenerated notes get a new version and therefore new URLs.
+NOTES_RENDER_VERSION = "1"
+NOTES_INITIAL_SECTIONS = int(os.getenv("NOTES_INITIAL_SECTIONS", "2"))
+NOTES_SECTION_BATCH = int(os.getenv("NOTES_SECTION_BATCH", "3"))
+MARKDOWN_EXTENSIONS = ["fenced_code"]
+NOTES_VERSION_SQL = "left(md5(notes_markdown), 12) || '.' || %(version)s"
+
+_rendered = cache.TTLCache(maxsize=int(os.getenv("NOTES_RENDER_CACHE_SIZE", "2000")), ttl=3600)
+_stats = {"rendered": 0, "reused": 0}
+_stats_lock = threading.Lock()
+
+_heading_re = re.compile(r"^ {0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_fence_re = re.compile(r"^\s*(```|~~~)")
+_mermaid_re = re.compile(r'<pre><code class="language-mermaid">(.*?)</code></pre>', re.S)
+
+
+def split_sections(notes_markdown):
+    """Returns [(title, markdown)], one per top-level topic, with any preamble kept in the first section."""
+    lines = notes_markdown.splitlines(keepends=True)
+    headings = []
+    in_fence = False
+    for i, line in enumerate(lines):
+        if _fence_re.match(line):
+            in_fence = not in_fence
+            continue
+        match = None if in_fence else _heading_re.match(line)
+        if match:
+            headings.append((i, len(match.group(1)), re.sub(r"[*_`]", "", match.group(2)).strip()))
+    levels = sorted({level for _, level, _ in headings})
+    split_level = next((level for level in levels
+                        if sum(1 for _, l, _ in headings if l == level) > 1), None)
+    if split_level is None:
+        title = headings[0][2] if headings else "Notes"
+        return [(title, notes_markdown)] if notes_markdown.strip() else []
+
+    starts = [(i, title) for i, level, title in headings if level == split_level]
+    if starts[0][0] > 0 and "".join(lines[:starts[0][0]]).strip():
+        # Title and introduction before the first topic become a section of their own.
+        intro_title = headings[0][2] if headings[0][0] < starts[0][0] else "Introduction"
+        starts.insert(0, (0, intro_title))
+    else:
+        starts[0] = (0, starts[0][1])
+    bounds = [i for i, _ in starts] + [len(lines)]
+    return [(title, "".join(lines[bounds[n]:bounds[n + 1]])) for n, (_, title) in enumerate(starts)]
+
+
+def section_hash(section_markdown):
+    return hashlib.sha256(f"{NOTES_RENDER_VERSION}\0{section_markdown}".encode("utf-8")).hexdigest()
+
+
+def _mermaid_block(match):
+    source = html.unescape(match.group(1))
+    diagram = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    return f'<pre class="mermaid" data-diagram="{diagram}">{html.escape(source, quote=False)}</pre>'
+
+
+def render_section(section_markdown):
+    import markdown
+    return _mermaid_re.sub(_mermaid_block, markdown.markdown(section_markdown, extensions=MARKDOWN_EXTENSIONS))
+
+
+def render_sections(cur, sections):
+    """Renders [(title, markdown)] to dicts with title, markdown, content_hash and html.
+
+    HTML is reused from the in-process cache, then from sections already
+    stored under the same content hash (one query); only the rest is rendered.
+    """
+    rendered = [{"title": title, "markdown": text, "content_hash": section_hash(text), "html": None}
+                for title, text in sections]
+    for section in rendered:
+        section["html"] = _rendered.get(section["content_hash"])
+    missing = list({s["content_hash"] for s in rendered if s["html"] is None})
+    stored = {}
+    if missing:
+        cur.execute("""SELECT DISTINCT ON (content_hash) content_hash, html FROM notes_sections
+                       WHERE content_hash = ANY(%s)""", (missing,))
+        stored = dict(cur.fetchall())
+    reused = 0
+    for section in rendered:
+        if section["html"] is not None:
+            reused += 1
+            continue
+        section["html"] = stored.get(section["content_hash"])
+        if section["html"] is None:
+            section["html"] = render_section(section["markdown"])
+        else:
+            reused += 1
+        _rendered.set(section["content_hash"], section["html"])
+    with _stats_lock:
+        _stats["reused"] += reused
+        _stats["rendered"] += len(rendered) - reused
+    return rendered
+
+
+def store_sections(cur, cache_key, notes_markdown):
+    """Splits, renders and stores the sections of a set of notes; the caller commits."""
+    rendered = render_sections(cur, split_sections(notes_markdown))
+    cur.execute("DELETE FROM notes_sections WHERE cache_key = %s AND position >= %s", (cache_key, len(rendered)))
+    if rendered:
+        execute_values(cur,
+            """INSERT INTO notes_sections (cache_key, position, title, markdown, content_hash, render_version, html)
+               VALUES %s
+               ON CONFLICT (cache_key, position) DO UPDATE
+               SET title = EXCLUDED.title, markdown = EXCLUDED.markdown, content_hash = EXCLUDED.content_hash,
+                   render_version = EXCLUDED.render_version, html = EXCLUDED.html""",
+            [(cache_key, i, s["title"], s["markdown"], s["content_hash"], NOTES_RENDER_VERSION, s["html"])
+             for i, s in enumerate(rendered)])
+    return [{"position": i, "title": s["title"], "html": s["html"]} for i, s in enumerate(rendered)]
+
+
+def _refresh_stale(cur, cache_key, rows):
+    """Re-renders rows stored by an older NOTES_RENDER_VERSION (those carrying markdown) and saves them."""
+    stale = [row for row in rows if row["markdown"] is not None]
+    if stale:
+        for row, section in zip(stale, render_sections(cur, [(row["title"], row["markdown"]) for row in stale])):
+            row["html"] = section["html"]
+            row["content_hash"] = section["content_hash"]
+        execute_values(cur,
+            """UPDATE notes_sections AS s
+               SET html = v.html, content_hash = v.content_hash, render_version = v.render_version
+               FROM (VALUES %s) AS v (cache_key, position, content_hash, render_version, html)
+               WHERE s.cache_key = v.cache_key AND s.position = v.position""",
+            [(cache_key, row["position"], row["content_hash"], NOTES_RENDER_VERSION, row["html"])
+             for row in stale])
+    return [{"position": row["position"], "title": row["title"], "html": row["html"]} for row in rows]
+
+
+def load_outline(cur, cache_key, initial=NOTES_INITIAL_SECTIONS):
+    """Marks cached notes as used and returns (sections, version), with HTML for the first `initial` sections only.
+
+    version identifies the stored notes (see NOTES_VERSION_SQL). Returns
+    (None, None) when the notes are not cached. Notes stored before they were
+    split into sections are split on first view. The caller commits.
+    """
+    cur.execute(f"""
+        WITH touched AS (
+            UPDATE notes_cache SET last_used_at = NOW() WHERE cache_key = %(key)s
+            RETURNING cache_key, notes_markdown, {NOTES_VERSION_SQL} AS notes_version
+        )
+        SELECT s.position, s.title,
+               CASE WHEN s.position < %(initial)s AND s.render_version = %(version)s THEN s.html END,
+               CASE WHEN s.position < %(initial)s AND s.render_version <> %(version)s THEN s.markdown END,
+               CASE WHEN s.cache_key IS NULL THEN t.notes_markdown END,
+               t.notes_version
+        FROM touched t LEFT JOIN notes_sections s ON s.cache_key = t.cache_key
+        ORDER BY s.position
+    """, {"key": cache_key, "initial": initial, "version": NOTES_RENDER_VERSION})
+    rows = cur.fetchall()
+    if not rows:
+        return None, None
+    notes_version = rows[0][5]
+    if rows[0][0] is None:
+        sections = store_sections(cur, cache_key, rows[0][4])
+        for section in sections[initial:]:
+            section["html"] = None
+        return sections, notes_version
+    return _refresh_stale(cur, cache_key, [{"position": position, "title": title, "html": section_html,
+                                            "markdown": section_markdown}
+                                           for position, title, section_html, section_markdown, _, _ in rows]), notes_version
+
+
+def load_sections(cur, cache_key, start, count=NOTES_SECTION_BATCH):
+    """Returns ([{position, title, html}] for sections start..start+count-1, version of the stored notes).
+
+    version is None when the notes are not cached.
+    """
+    cur.execute(f"""SELECT s.position, s.title,
+                           CASE WHEN s.render_version = %(version)s THEN s.html END,
+                           CASE WHEN s.render_version <> %(version)s THEN s.markdown END,
+                           {NOTES_VERSION_SQL}
+                    FROM notes_cache LEFT JOIN notes_sections s
+                      ON s.cache_key = notes_cache.cache_key AND s.position >= %(start)s AND s.position < %(end)s
+                    WHERE notes_cache.cache_key = %(key)s
+                    ORDER BY s.position""",
+                {"key": cache_key, "start": start, "end": start + count, "version": NOTES_RENDER_VERSION})
+    rows = cur.fetchall()
+    if not rows:
+        return [], None
+    return _refresh_stale(cur, cache_key, [{"position": position, "title": title, "html": section_html,
+                                            "markdown": section_markdown}
+                                           for position, title, section_html, section_markdown, _ in rows
+                                           if position is not None]), rows[0][4]
+
+
+def render_stats():
+    with _stats_lock:
+        return dict(_stats, **_rendered.stats())
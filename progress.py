@@ -0,0 +1,79 @@
+import os
+
+# ---------------- QUIZ PROGRESS ----------------
+# Each submitted quiz is a row in quiz_attempts. subject_progress keeps the
+# per-subject aggregate: attempt count, mean, an exponential moving average
+# (the progress shown on the dashboard), the change the latest attempt made
+# to it (trend), and the best and latest score. Recording an attempt and
+# folding it into the aggregate is one statement. The dashboard reads every
+# subject with its aggregate in one indexed query.
+#
+# QUIZ_PROGRESS_ALPHA is the weight of the newest attempt in the moving
+# average. 0.5 matches the old (progress + score) / 2 rule.
+QUIZ_PROGRESS_ALPHA = float(os.getenv("QUIZ_PROGRESS_ALPHA", "0.5"))
+
+
+def record_attempt(cur, user_id, subject_id, score, total):
+    """Stores an attempt and updates the subject's aggregate; returns the aggregate, or None if not the user's subject.
+
+    total must be positive: a quiz with no gradable questions is not an attempt. The caller commits.
+    """
+    if total <= 0:
+        raise ValueError("A quiz attempt needs at least one question")
+    percentage = (score / total) * 100
+    cur.execute("""
+        WITH attempt AS (
+            INSERT INTO quiz_attempts (user_id, subject_id, score, total, percentage)
+            SELECT user_id, id, %(score)s, %(total)s, %(percentage)s FROM subjects
+            WHERE id = %(subject_id)s AND user_id = %(user_id)s
+            RETURNING user_id, subject_id, percentage, created_at
+        )
+        INSERT INTO subject_progress AS p (subject_id, user_id, attempts, average, moving_average, trend,
+                                           best_percentage, last_percentage, last_attempt_at)
+        SELECT subject_id, user_id, 1, percentage, percentage, 0, percentage, percentage, created_at FROM attempt
+        ON CONFLICT (subject_id) DO UPDATE
+        SET attempts = p.attempts + 1,
+            average = (p.average * p.attempts + EXCLUDED.last_percentage) / (p.attempts + 1),
+            moving_average = %(alpha)s * EXCLUDED.last_percentage + (1 - %(alpha)s) * p.moving_average,
+            trend = %(alpha)s * (EXCLUDED.last_percentage - p.moving_average),
+            best_percentage = GREATEST(p.best_percentage, EXCLUDED.last_percentage),
+            last_percentage = EXCLUDED.last_percentage,
+            last_attempt_at = EXCLUDED.last_attempt_at
+        RETURNING attempts, average, moving_average, trend
+    """, {"user_id": user_id, "subject_id": subject_id, "score": score, "total": total,
+          "percentage": percentage, "alpha": QUIZ_PROGRESS_ALPHA})
+    row = cur.fetchone()
+    if row is None:
+        return None
+    attempts, average, moving_average, trend = row
+    return {"attempts": attempts, "average": average, "progress": round(moving_average), "trend": trend}
+
+
+def load_dashboard(cur, user_id):
+    """Returns the user's subjects with their progress aggregate, ordered by name."""
+    cur.execute("""
+        SELECT s.id, s.name,
+               COALESCE(ROUND(p.moving_average)::int, 0) AS progress,
+               COALESCE(p.attempts, 0) AS attempts,
+               ROUND(p.average)::int AS average,
+               ROUND(p.best_percentage)::int AS best,
+               ROUND(p.last_percentage)::int AS last,
+               ROUND(p.trend)::int AS trend,
+               p.last_attempt_at
+        FROM subjects s LEFT JOIN subject_progress p ON p.subject_id = s.id
+        WHERE s.user_id = %s
+        ORDER BY s.name
+    """, (user_id,))
+    return cur.fetchall()
+
+
+def delete_user_subjects(cur, user_id):
+    """Deletes a user's subjects with their topics, attempts and aggregates in one statement; the caller commits."""
+    cur.execute("""
+        WITH doomed AS (SELECT id FROM subjects WHERE user_id = %(user_id)s),
+        attempts AS (DELETE FROM quiz_attempts WHERE subject_id IN (SELECT id FROM doomed)),
+        aggregates AS (DELETE FROM subject_progress WHERE subject_id IN (SELECT id FROM doomed)),
+        topics AS (DELETE FROM topics WHERE subject_id IN (SELECT id FROM doomed))
+        DELETE FROM subjects WHERE id IN (SELECT id FROM doomed)
+    """, {"user_id": user_id})
+    return cur.rowcount
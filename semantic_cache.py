@@ -0,0 +1,185 @@
+import os
+import re
+import threading
+import time
+import zlib
+
+# ---------------- SEMANTIC RESPONSE CACHE ----------------
+# Opt-in (SEMANTIC_CACHE_ENABLED=1) cache in front of the /chat completion.
+# A prompt and the last couple of messages before it are embedded as signed,
+# hashed character n-gram vectors (no model download, ~1 ms on CPU). A
+# near-duplicate whose cosine similarity is at least SEMANTIC_CACHE_THRESHOLD
+# gets the stored answer instead of a Groq call. Entries live in one
+# preallocated NumPy matrix per worker process. Lookup is a single
+# matrix-vector product. Entries expire after SEMANTIC_CACHE_TTL seconds and
+# the least recently used one is evicted when the matrix is full. NumPy is
+# imported on first use, so it is never loaded while the cache is disabled.
+#
+# SEMANTIC_CACHE_SCOPE=user only serves a user their own earlier answers;
+# "global" shares answers between users, which only suits deployments
+# where chats carry no private context.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_SCOPE = os.getenv("SEMANTIC_CACHE_SCOPE", "user")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+# How much the preceding messages count relative to the prompt itself. With
+# 0.5, an identical prompt after an unrelated conversation scores ~0.8, so
+# follow-ups like "explain more" only match within the same context.
+CONTEXT_WEIGHT = 0.5
+CONTEXT_MESSAGES = 2
+NGRAM_SIZES = (3, 4)
+# Answers this short are usually errors or clarifying questions; never cache them.
+MIN_ANSWER_CHARS = 20
+
+GLOBAL_SCOPE = 0
+
+_normalise_re = re.compile(r"[^\w\s]+")
+_space_re = re.compile(r"\s+")
+
+
+def normalise(text):
+    return _space_re.sub(" ", _normalise_re.sub(" ", text.lower())).strip()
+
+
+def embed(text, dim=SEMANTIC_CACHE_DIM):
+    """Signed feature hashing of word unigrams and character n-grams, L2-normalised."""
+    import numpy as np
+    text = normalise(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    if not text:
+        return vector
+    padded = f" {text} "
+    features = text.split(" ")
+    for n in NGRAM_SIZES:
+        features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+    vector += np.bincount(hashes % dim, weights=signs, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_turn(prompt, context_messages=()):
+    import numpy as np
+    vector = embed(prompt)
+    context = " ".join(context_messages[-CONTEXT_MESSAGES:])
+    if context:
+        vector = vector + CONTEXT_WEIGHT * embed(context)
+        vector /= np.linalg.norm(vector) or 1.0
+    return vector
+
+
+class SemanticCache:
+    """Fixed-capacity nearest-neighbour answer cache with TTL and LRU eviction."""
+
+    def __init__(self, capacity, dim, ttl, threshold):
+        import numpy as np
+        self.capacity = capacity
+        self.dim = dim
+        self.ttl = ttl
+        self.threshold = threshold
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._scopes = np.full(capacity, -1, dtype=np.int64)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._answers = [None] * capacity
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def _best(self, scope, vector, now):
+        import numpy as np
+        live = (self._scopes == scope) & (self._expires > now)
+        if not live.any():
+            return None, 0.0
+        scores = self._vectors @ vector
+        scores[~live] = -1.0
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def lookup(self, scope, vector):
+        """Returns (answer, similarity) for the nearest live entry above the threshold, else (None, best)."""
+        now = time.monotonic()
+        with self._lock:
+            index, score = self._best(scope, vector, now)
+            if index is None or score < self.threshold:
+                self._stats["misses"] += 1
+                return None, score
+            self._last_used[index] = now
+            self._stats["hits"] += 1
+            return self._answers[index], score
+
+    def store(self, scope, vector, answer):
+        import numpy as np
+        now = time.monotonic()
+        with self._lock:
+            index, score = self._best(scope, vector, now)
+            if index is None or score < 0.99:
+                # Reuse an empty or expired slot first, else evict the least recently used entry.
+                free = np.flatnonzero(self._expires <= now)
+                if free.size:
+                    index = int(free[0])
+                    if self._answers[index] is not None:
+                        self._stats["expired"] += 1
+                else:
+                    index = int(np.argmin(self._last_used))
+                    self._stats["evictions"] += 1
+            self._vectors[index] = vector
+            self._scopes[index] = scope
+            self._expires[index] = now + self.ttl
+            self._last_used[index] = now
+            self._answers[index] = answer
+            self._stats["stores"] += 1
+
+    def clear(self, scope=None):
+        with self._lock:
+            mask = slice(None) if scope is None else (self._scopes == scope)
+            self._expires[mask] = 0.0
+            self._scopes[mask] = -1
+
+    def stats(self):
+        import numpy as np
+        with self._lock:
+            size = int(np.count_nonzero(self._expires > time.monotonic()))
+            return dict(self._stats, size=size, capacity=self.capacity)
+
+
+# ---------------- PER-PROCESS CACHE ----------------
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_DIM,
+                                       SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD)
+    return _cache
+
+
+def scope_for(user_id):
+    return GLOBAL_SCOPE if SEMANTIC_CACHE_SCOPE == "global" else int(user_id)
+
+
+def lookup(user_id, prompt, context_messages=()):
+    """Returns (answer or None, key vector); pass the vector back to store() after a miss."""
+    if not SEMANTIC_CACHE_ENABLED or not prompt:
+        return None, None
+    vector = embed_turn(prompt, context_messages)
+    answer, _ = get_cache().lookup(scope_for(user_id), vector)
+    return answer, vector
+
+
+def store(user_id, vector, answer):
+    if vector is None or not answer or len(answer) < MIN_ANSWER_CHARS:
+        return
+    get_cache().store(scope_for(user_id), vector, answer)
+
+
+def cache_stats():
+    if not SEMANTIC_CACHE_ENABLED:
+        return {"enabled": False}
+    return dict(get_cache().stats(), enabled=True)
@@ -83,10 +83,36 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // Conversation Management (with Delete functionality)
+    // The sidebar and the chat history are both paged by the server; more
+    // conversations load when the sidebar is scrolled to the bottom and older
+    // messages load when the chat is scrolled to the top.
+    let conversationsCursor = null;
+    let loadingConversations = false;
+    let olderMessagesBefore = null;
+    let loadingOlderMessages = false;
+
+    historyList.addEventListener('scroll', () => {
+        if (historyList.scrollTop + historyList.clientHeight >= historyList.scrollHeight - 50) {
+            loadMoreConversations();
+        }
+    });
+
+    chatMessages.addEventListener('scroll', () => {
+        if (chatMessages.scrollTop < 50) loadOlderMessages();
+    });
+
+    async function fetchConversations(cursor) {
+        const url = cursor ? `/get_conversations?cursor=${encodeURIComponent(cursor)}` : '/get_conversations';
+        const response = await fetch(url);
+        if (response.status === 401) { window.location.href = '/login'; return null; }
+        return response.json();
+    }
+
     async function loadConversations() {
+        loadingConversations = true;
         try {
-            const response = await fetch('/get_conversations');
-            const conversations = await response.json();
+            const page = await fetchConversations(null);
+            if (!page) return;
             historyList.innerHTML = '';
 
             const newConvBtn = document.createElement('li');
@@ -95,35 +121,62 @@ document.addEventListener('DOMContentLoaded', () => {
             newConvBtn.addEventListener('click', createNewConversation);
             historyList.appendChild(newConvBtn);
 
-            conversations.forEach(conv => {
-                const historyItem = document.createElement('li');
-                historyItem.dataset.id = conv.id;
-                
-                const titleSpan = document.createElement('span');
-                titleSpan.textContent = conv.title || `Conversation ${conv.id}`;
-                titleSpan.classList.add('history-title');
-
-                const deleteBtn = document.createElement('button');
-                deleteBtn.innerHTML = `&times;`;
-                deleteBtn.classList.add('delete-conv-btn');
-                deleteBtn.title = 'Delete conversation';
-
-                historyItem.appendChild(titleSpan);
-                historyItem.appendChild(deleteBtn);
-
-                titleSpan.addEventListener('click', () => setActiveConversation(conv.id));
-                deleteBtn.addEventListener('click', (e) => {
-                    e.stopPropagation();
-                    confirmAndDelete(conv.id, conv.title);
-                });
+            page.conversations.forEach(renderConversationItem);
+            conversationsCursor = page.next_cursor;
+        } catch (error) {
+            console.error("Error loading conversations:", error);
+        } finally {
+            loadingConversations = false;
+        }
+        // Keep loading while the list is too short to scroll.
+        if (conversationsCursor && historyList.scrollHeight <= historyList.clientHeight) {
+            loadMoreConversations();
+        }
+    }
 
-                historyList.appendChild(historyItem);
-            });
+    async function loadMoreConversations() {
+        if (loadingConversations || !conversationsCursor) return;
+        loadingConversations = true;
+        try {
+            const page = await fetchConversations(conversationsCursor);
+            if (!page) return;
+            page.conversations.forEach(renderConversationItem);
+            conversationsCursor = page.next_cursor;
         } catch (error) {
             console.error("Error loading conversations:", error);
+        } finally {
+            loadingConversations = false;
         }
     }
 
+    function renderConversationItem(conv) {
+        // Conversations move up the list as they are used, so a later page can repeat one.
+        if ([...historyList.children].some(li => li.dataset?.id == conv.id)) return;
+        const historyItem = document.createElement('li');
+        historyItem.dataset.id = conv.id;
+        if (conv.id == currentConversationId) historyItem.classList.add('active');
+
+        const titleSpan = document.createElement('span');
+        titleSpan.textContent = conv.title || `Conversation ${conv.id}`;
+        titleSpan.classList.add('history-title');
+
+        const deleteBtn = document.createElement('button');
+        deleteBtn.innerHTML = `&times;`;
+        deleteBtn.classList.add('delete-conv-btn');
+        deleteBtn.title = 'Delete conversation';
+
+        historyItem.appendChild(titleSpan);
+        historyItem.appendChild(deleteBtn);
+
+        titleSpan.addEventListener('click', () => setActiveConversation(conv.id));
+        deleteBtn.addEventListener('click', (e) => {
+            e.stopPropagation();
+            confirmAndDelete(conv.id, conv.title);
+        });
+
+        historyList.appendChild(historyItem);
+    }
+
     async function confirmAndDelete(conversationId, title) {
         addMessageToChat('bot', `Are you sure you want to delete "${title}"? This cannot be undone. 
             <button class="btn btn-danger btn-sm m-1" onclick="performDelete(${conversationId})">Yes, Delete</button>`);
@@ -149,6 +202,7 @@ document.addEventListener('DOMContentLoaded', () => {
     async function createNewConversation() {
         closeSidebar(); // <-- MODIFIED: Close sidebar when starting a new chat
         currentConversationId = null;
+        olderMessagesBefore = null;
         chatMessages.innerHTML = '<div class="message bot"><div class="message-content">New chat started. Ask me anything!</div></div>';
         document.querySelectorAll('#history-list li').forEach(li => li.classList.remove('active'));
     }
@@ -160,17 +214,43 @@ document.addEventListener('DOMContentLoaded', () => {
         const activeItem = [...historyList.children].find(li => li.dataset?.id == conversationId);
         if (activeItem) activeItem.classList.add('active');
 
+        olderMessagesBefore = null;
         try {
             const response = await fetch(`/get_chat/${conversationId}`);
             if (response.status === 401) { window.location.href = '/login'; return; }
-            const messages = await response.json();
+            const page = await response.json();
             chatMessages.innerHTML = '';
-            messages.forEach(msg => addMessageToChat(msg.sender, msg.message));
+            page.messages.forEach(msg => addMessageToChat(msg.sender, msg.message));
+            olderMessagesBefore = page.next_before;
         } catch (error) {
             console.error("Error loading chat history:", error);
         }
     }
 
+    async function loadOlderMessages() {
+        if (loadingOlderMessages || !olderMessagesBefore || !currentConversationId) return;
+        loadingOlderMessages = true;
+        const conversationId = currentConversationId;
+        try {
+            const response = await fetch(`/get_chat/${conversationId}?before=${olderMessagesBefore}`);
+            if (response.status === 401) { window.location.href = '/login'; return; }
+            const page = await response.json();
+            if (conversationId !== currentConversationId) return;
+
+            // Prepend without moving what the user is looking at.
+            const previousHeight = chatMessages.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            page.messages.forEach(msg => fragment.appendChild(createMessageElement(msg.sender, msg.message)));
+            chatMessages.insertBefore(fragment, chatMessages.firstChild);
+            chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+            olderMessagesBefore = page.next_before;
+        } catch (error) {
+            console.error("Error loading older messages:", error);
+        } finally {
+            loadingOlderMessages = false;
+        }
+    }
+
     // Message Handling
     function handleFormSubmit(event) {
         event.preventDefault();
@@ -193,18 +273,28 @@ document.addEventListener('DOMContentLoaded', () => {
         fileUpload.value = '';
     }
 
-    function addMessageToChat(sender, text) {
+    function formatMessage(text) {
+        text = text.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
+        return text.replace(/\n/g, '<br>');
+    }
+
+    function createMessageElement(sender, text) {
         const messageElement = document.createElement('div');
         messageElement.classList.add('message', sender);
         const contentElement = document.createElement('div');
         contentElement.classList.add('message-content');
         
-        text = text.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
-        contentElement.innerHTML = text.replace(/\n/g, '<br>');
+        contentElement.innerHTML = formatMessage(text);
 
         messageElement.appendChild(contentElement);
+        return messageElement;
+    }
+
+    function addMessageToChat(sender, text) {
+        const messageElement = createMessageElement(sender, text);
         chatMessages.appendChild(messageElement);
         scrollToBottom();
+        return messageElement.firstChild;
     }
 
     function showTypingIndicator() {
@@ -228,22 +318,42 @@ document.addEventListener('DOMContentLoaded', () => {
         if (message) formData.append('message', message);
         if (file) formData.append('file', file);
         if (currentConversationId) formData.append('conversation_id', currentConversationId);
+        formData.append('stream', '1');
 
         try {
             const response = await fetch('/chat', { method: 'POST', body: formData });
-            removeTypingIndicator();
             if (!response.ok) {
+                removeTypingIndicator();
                 if (response.status === 401) window.location.href = '/login';
+                if (response.status === 429 || response.status === 503) {
+                    // Busy (too many requests in progress, or the AI service is down): show the server's message.
+                    const data = await response.json().catch(() => ({}));
+                    addMessageToChat('bot', data.error || 'The server is busy. Please try again shortly.');
+                    return;
+                }
                 throw new Error(`Server error: ${response.statusText}`);
             }
-            const data = await response.json();
-            addMessageToChat('bot', data.response);
 
-            if (!currentConversationId && data.conversation_id) {
-                currentConversationId = data.conversation_id;
+            let conversationId = null;
+            const contentType = response.headers.get('Content-Type') || '';
+            if (contentType.includes('text/event-stream')) {
+                conversationId = await readChatStream(response);
+            } else {
+                removeTypingIndicator();
+                const data = await response.json();
+                addMessageToChat('bot', data.response);
+                conversationId = data.conversation_id;
+            }
+
+            if (!currentConversationId && conversationId) {
+                currentConversationId = conversationId;
                 await loadConversations();
                 const activeItem = [...historyList.children].find(li => li.dataset?.id == currentConversationId);
                 if (activeItem) activeItem.classList.add('active');
+            } else {
+                // The sidebar is ordered by recent activity.
+                const activeItem = [...historyList.children].find(li => li.dataset?.id == currentConversationId);
+                if (activeItem) historyList.insertBefore(activeItem, historyList.children[1] || null);
             }
         } catch (error) {
             removeTypingIndicator();
@@ -252,6 +362,56 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Renders a Server-Sent Events reply from /chat token by token.
+    // Returns the conversation id announced in the "meta" event.
+    async function readChatStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let replyText = '';
+        let contentElement = null;
+        let conversationId = null;
+
+        const handleEvent = (event, data) => {
+            if (event === 'meta') {
+                conversationId = data.conversation_id;
+            } else if (event === 'token') {
+                if (!contentElement) {
+                    removeTypingIndicator();
+                    contentElement = addMessageToChat('bot', '');
+                }
+                replyText += data.content;
+                contentElement.innerHTML = formatMessage(replyText);
+                scrollToBottom();
+            } else if (event === 'error') {
+                throw new Error(data.error || 'Stream error');
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (data) handleEvent(event, JSON.parse(data));
+            }
+        }
+
+        removeTypingIndicator();
+        if (!contentElement) addMessageToChat('bot', 'Sorry, something went wrong.');
+        return conversationId;
+    }
+
     function scrollToBottom() {
         chatMessages.scrollTop = chatMessages.scrollHeight;
     }
@@ -0,0 +1,58 @@
+import json
+import re
+
+from psycopg2.extras import execute_values
+
+# ---------------- SYLLABUS INGESTION ----------------
+# A parsed syllabus is written with a constant number of statements no matter
+# how many subjects and topics it has: one for the syllabus row, one multi-row
+# INSERT for all subjects and one for all topics.
+
+
+def _clean(name):
+    return re.sub(r"\s+", " ", str(name or "")).strip()
+
+
+def normalise_subjects(parsed_data):
+    """Returns [(subject_name, [topic, ...])] with blanks and duplicates removed.
+
+    Names are compared case-insensitively after collapsing whitespace; the first
+    spelling wins and topics of repeated subjects are merged.
+    """
+    subjects = {}
+    for subject_data in parsed_data.get("subjects", []) or []:
+        if not isinstance(subject_data, dict):
+            continue
+        name = _clean(subject_data.get("name"))
+        if not name:
+            continue
+        _, topics, seen = subjects.setdefault(name.casefold(), (name, [], set()))
+        for topic in subject_data.get("topics", []) or []:
+            topic = _clean(topic)
+            if topic and topic.casefold() not in seen:
+                seen.add(topic.casefold())
+                topics.append(topic)
+    return [(name, topics) for name, topics, _ in subjects.values()]
+
+
+def insert_syllabus(cur, user_id, filename, parsed_data):
+    """Inserts a syllabus with its subjects and topics; returns (syllabus_id, subject_count)."""
+    cur.execute("INSERT INTO syllabuses (user_id, filename, parsed_content) VALUES (%s, %s, %s) RETURNING id",
+        (user_id, filename, json.dumps(parsed_data)))
+    syllabus_id = cur.fetchone()[0]
+
+    subjects = normalise_subjects(parsed_data)
+    if not subjects:
+        return syllabus_id, 0
+
+    rows = execute_values(cur,
+        "INSERT INTO subjects (syllabus_id, user_id, name) VALUES %s RETURNING id, name",
+        [(syllabus_id, user_id, name) for name, _ in subjects],
+        page_size=len(subjects), fetch=True)
+    subject_ids = {name: subject_id for subject_id, name in rows}
+
+    topic_rows = [(subject_ids[name], topic) for name, topics in subjects for topic in topics]
+    if topic_rows:
+        execute_values(cur, "INSERT INTO topics (subject_id, name) VALUES %s", topic_rows,
+            page_size=len(topic_rows))
+    return syllabus_id, len(subjects)
@@ -0,0 +1,12 @@
+from app import app
+import jobs
+
+# Background job worker. Run one or more of these next to the web processes:
+#
+#   python worker.py
+#
+# Workers coordinate through the jobs table (SELECT ... FOR UPDATE SKIP LOCKED),
+# so no external broker is needed.
+
+if __name__ == "__main__":
+    jobs.work(app)